@@ -1,13 +1,14 @@
-DROP TABLE IF EXISTS configurations;
-DROP TABLE IF EXISTS firmwares;
-DROP TABLE IF EXISTS mechanic_tests;
+-- Latest schema, for new databases. Existing databases are upgraded in place
+-- by the migrations in migrations/, which the car applies when it starts.
+-- A schema change goes into a new migration, and here.
 
 -- SQL Dump for 'configurations' table
 CREATE TABLE IF NOT EXISTS configurations (
     id SERIAL PRIMARY KEY,          -- Unique identifier for the update
     car_id INTEGER NOT NULL,        -- Foreign key for the car ID
     user_id VARCHAR(50) NOT NULL,   -- User ID who made the update
-    config JSON NOT NULL            -- Configuration details in JSON format
+    config JSON NOT NULL,           -- Configuration details in JSON format
+    is_delta BOOLEAN NOT NULL DEFAULT FALSE -- Field-level delta over the previous rows
 );
 
 -- SQL Dump for 'firmwares' table
@@ -16,10 +17,20 @@ CREATE TABLE IF NOT EXISTS firmwares (
     car_id INTEGER NOT NULL,        -- Foreign key for the car ID
     firmware VARCHAR(50) NOT NULL,   -- Firmware version
     signature TEXT NOT NULL,        -- signature of the firmware
-    timestamp TIMESTAMP NOT NULL    -- Timestamp of the update
+    timestamp TIMESTAMP NOT NULL,   -- Timestamp of the update
+    verified BOOLEAN,               -- Whether the signature verified, NULL if not checked yet
+    signer_fingerprint TEXT,        -- SHA-256 fingerprint of the signer's certificate
+    verified_at TIMESTAMP           -- When the signature was last verified
 );
 
 
+-- SQL Dump for 'mechanic_certificates' table
+CREATE TABLE IF NOT EXISTS mechanic_certificates (
+    id SERIAL PRIMARY KEY,              -- Unique identifier for the certificate
+    fingerprint TEXT NOT NULL UNIQUE,   -- SHA-256 fingerprint of the DER certificate
+    certificate TEXT NOT NULL           -- Mechanic certificate, in PEM
+);
+
 -- SQL Dump for 'mechanic_tests' table
 CREATE TABLE IF NOT EXISTS mechanic_tests (
     id SERIAL PRIMARY KEY,          -- Unique identifier for the update
@@ -27,9 +38,57 @@ CREATE TABLE IF NOT EXISTS mechanic_tests (
     tests JSON NOT NULL,             -- Test details in JSON format
     signature TEXT NOT NULL,        -- signature of the test
     timestamp TIMESTAMP NOT NULL,   -- Timestamp of the update
-    mechanic_cert TEXT NOT NULL     -- Mechanic certificate
+    mechanic_cert_id INTEGER NOT NULL REFERENCES mechanic_certificates (id), -- Mechanic certificate
+    verified BOOLEAN,               -- Whether the signature verified, NULL if not checked yet
+    signer_fingerprint TEXT,        -- SHA-256 fingerprint of the signer's certificate
+    verified_at TIMESTAMP           -- When the signature was last verified
+);
+
+-- SQL Dump for 'car_state' table, shared by the workers of a multi-worker car server
+CREATE TABLE IF NOT EXISTS car_state (
+    car_id INTEGER PRIMARY KEY,         -- Car ID
+    battery_level INTEGER NOT NULL,     -- Battery level in percent
+    op_count INTEGER NOT NULL,          -- Operations since the battery last drained
+    maintenance_mode BOOLEAN NOT NULL,  -- Whether maintenance mode is on
+    mechanic_config JSON NOT NULL,      -- Configuration set by the mechanic
+    encrypted_car_key TEXT              -- Car key, encrypted to the car's certificate
+);
+
+-- SQL Dump for 'verification_watermarks' table, progress of the re-verification job
+CREATE TABLE IF NOT EXISTS verification_watermarks (
+    car_id INTEGER NOT NULL,            -- Car ID
+    table_name VARCHAR(50) NOT NULL,    -- Table whose signatures are verified
+    last_id INTEGER NOT NULL,           -- Rows up to this id were verified
+    trust_anchors TEXT NOT NULL,        -- Fingerprint of the trust anchors they were verified against
+    PRIMARY KEY (car_id, table_name)
+);
+
+CREATE INDEX IF NOT EXISTS configurations_car_user_id_idx
+    ON configurations (car_id, user_id, id DESC);
+CREATE INDEX IF NOT EXISTS firmwares_car_id_idx
+    ON firmwares (car_id, id DESC);
+CREATE INDEX IF NOT EXISTS mechanic_tests_car_id_idx
+    ON mechanic_tests (car_id, id DESC);
+
+-- Migrations this schema already includes
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
+INSERT INTO schema_migrations (version, name) VALUES
+    (1, 'initial_schema'),
+    (2, 'configuration_deltas'),
+    (3, 'car_state'),
+    (4, 'signature_status'),
+    (5, 'history_indexes'),
+    (6, 'mechanic_certificates')
+ON CONFLICT DO NOTHING;
 
 ALTER TABLE configurations OWNER TO "car1-web";
 ALTER TABLE firmwares OWNER TO "car1-web";
+ALTER TABLE mechanic_certificates OWNER TO "car1-web";
 ALTER TABLE mechanic_tests OWNER TO "car1-web";
+ALTER TABLE car_state OWNER TO "car1-web";
+ALTER TABLE verification_watermarks OWNER TO "car1-web";
+ALTER TABLE schema_migrations OWNER TO "car1-web";
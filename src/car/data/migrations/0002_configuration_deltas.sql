@@ -0,0 +1,3 @@
+-- Configuration updates stored as field-level deltas over the previous rows.
+ALTER TABLE configurations
+    ADD COLUMN IF NOT EXISTS is_delta BOOLEAN NOT NULL DEFAULT FALSE;
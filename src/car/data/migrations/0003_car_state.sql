@@ -0,0 +1,11 @@
+-- SQL Dump for 'car_state' table, shared by the workers of a multi-worker car server
+CREATE TABLE IF NOT EXISTS car_state (
+    car_id INTEGER PRIMARY KEY,         -- Car ID
+    battery_level INTEGER NOT NULL,     -- Battery level in percent
+    op_count INTEGER NOT NULL,          -- Operations since the battery last drained
+    maintenance_mode BOOLEAN NOT NULL,  -- Whether maintenance mode is on
+    mechanic_config JSON NOT NULL,      -- Configuration set by the mechanic
+    encrypted_car_key TEXT              -- Car key, encrypted to the car's certificate
+);
+
+ALTER TABLE car_state OWNER TO "car1-web";
@@ -0,0 +1,21 @@
+-- Signature statuses recorded when rows are stored, NULL until verified.
+ALTER TABLE firmwares
+    ADD COLUMN IF NOT EXISTS verified BOOLEAN,
+    ADD COLUMN IF NOT EXISTS signer_fingerprint TEXT,
+    ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP;
+
+ALTER TABLE mechanic_tests
+    ADD COLUMN IF NOT EXISTS verified BOOLEAN,
+    ADD COLUMN IF NOT EXISTS signer_fingerprint TEXT,
+    ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP;
+
+-- SQL Dump for 'verification_watermarks' table, progress of the re-verification job
+CREATE TABLE IF NOT EXISTS verification_watermarks (
+    car_id INTEGER NOT NULL,            -- Car ID
+    table_name VARCHAR(50) NOT NULL,    -- Table whose signatures are verified
+    last_id INTEGER NOT NULL,           -- Rows up to this id were verified
+    trust_anchors TEXT NOT NULL,        -- Fingerprint of the trust anchors they were verified against
+    PRIMARY KEY (car_id, table_name)
+);
+
+ALTER TABLE verification_watermarks OWNER TO "car1-web";
@@ -0,0 +1,8 @@
+-- Every hot query reads one car's rows, newest or oldest first. These indexes
+-- serve both orders, instead of scanning and sorting whole tables.
+CREATE INDEX IF NOT EXISTS configurations_car_user_id_idx
+    ON configurations (car_id, user_id, id DESC);
+CREATE INDEX IF NOT EXISTS firmwares_car_id_idx
+    ON firmwares (car_id, id DESC);
+CREATE INDEX IF NOT EXISTS mechanic_tests_car_id_idx
+    ON mechanic_tests (car_id, id DESC);
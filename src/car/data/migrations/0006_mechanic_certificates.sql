@@ -0,0 +1,40 @@
+-- Mechanic certificates are stored once, and referenced by the tests they signed.
+
+-- SQL Dump for 'mechanic_certificates' table
+CREATE TABLE IF NOT EXISTS mechanic_certificates (
+    id SERIAL PRIMARY KEY,              -- Unique identifier for the certificate
+    fingerprint TEXT NOT NULL UNIQUE,   -- SHA-256 fingerprint of the DER certificate
+    certificate TEXT NOT NULL           -- Mechanic certificate, in PEM
+);
+
+ALTER TABLE mechanic_certificates OWNER TO "car1-web";
+
+ALTER TABLE mechanic_tests
+    ADD COLUMN IF NOT EXISTS mechanic_cert_id INTEGER REFERENCES mechanic_certificates (id);
+
+-- The fingerprint of a PEM certificate is the SHA-256 of its base64 body.
+CREATE FUNCTION pg_temp.pem_fingerprint(pem TEXT) RETURNS TEXT AS $$
+    SELECT encode(
+        sha256(decode(regexp_replace(pem, '-----[A-Z ]+-----|\s', '', 'g'), 'base64')),
+        'hex'
+    );
+$$ LANGUAGE SQL IMMUTABLE;
+
+INSERT INTO mechanic_certificates (fingerprint, certificate)
+SELECT DISTINCT ON (fingerprint) fingerprint, mechanic_cert
+FROM (
+    SELECT pg_temp.pem_fingerprint(mechanic_cert) AS fingerprint, mechanic_cert
+    FROM mechanic_tests
+) AS certs
+ON CONFLICT (fingerprint) DO NOTHING;
+
+UPDATE mechanic_tests
+SET mechanic_cert_id = mechanic_certificates.id
+FROM mechanic_certificates
+WHERE mechanic_certificates.fingerprint = pg_temp.pem_fingerprint(mechanic_tests.mechanic_cert);
+
+ALTER TABLE mechanic_tests ALTER COLUMN mechanic_cert_id SET NOT NULL;
+ALTER TABLE mechanic_tests DROP COLUMN mechanic_cert;
+
+-- pg_temp lives as long as the connection, which the pool keeps open.
+DROP FUNCTION pg_temp.pem_fingerprint(TEXT);
@@ -1,17 +1,35 @@
-from flask import Flask, request
+from flask import Flask, Response, has_request_context, request
+import collections
+import contextlib
+import copy
+import hashlib
 import json
 import os
+import queue
+import re
+import signal
+import socket
+import threading
+import time
+import traceback
 import cryptolib
-from cryptolib import PKI
+from cryptolib import PKI, SPLIT_FIELD
+from psycopg import sql
 from psycopg_pool import ConnectionPool
 import sys
 from enum import Enum
-from common import Common
+from datetime import datetime, timezone
+from common import Common, HandshakeStats
+from common.migrations import migrate
 
 import werkzeug.serving
+import werkzeug.wsgi
+from werkzeug.local import LocalProxy
+from werkzeug.exceptions import InternalServerError
 import ssl
-from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives import hashes, serialization
 from cryptography import x509
+from cryptography.exceptions import InvalidSignature
 
 req = Common.get_tls_session()
 
@@ -21,6 +39,53 @@ PG_CONNSTRING = os.getenv(
     "host=localhost port=7464 dbname=motorist-car-db user=postgres password=password",
 )
 MANUFACTURER_CERT = PKI.load_certificate(f"{Common.KEY_STORE}/manufacturer.crt")
+MANUFACTURER_FINGERPRINT = MANUFACTURER_CERT.fingerprint(hashes.SHA256()).hex()
+# Validates the certificate chain of every client (see `verify_peer_cert`).
+# Mechanic certificates must also be issued by its root.
+CA = PKI(Common.ROOT_CA_PATH)
+# Fingerprint of the trust anchors the stored signature statuses were checked
+# against. When it changes, every row is verified again (see `Car.reverify`).
+TRUST_ANCHORS = hashlib.sha256(
+    MANUFACTURER_CERT.public_bytes(serialization.Encoding.DER)
+    + CA.root_ca.public_bytes(serialization.Encoding.DER)
+).hexdigest()
+# Schema migrations applied on start, see `common.migrations`.
+MIGRATIONS_DIR = f"{os.path.dirname(__file__)}/data/migrations"
+# Seconds between runs of the re-verification job, 0 to never run it.
+REVERIFY_INTERVAL = float(os.getenv("REVERIFY_INTERVAL", "3600"))
+# A full configuration snapshot is stored after this many deltas, so that
+# rebuilding the current configuration never replays a longer chain.
+CONFIG_SNAPSHOT_INTERVAL = int(os.getenv("CONFIG_SNAPSHOT_INTERVAL", "20"))
+# First key of the per-car advisory locks on configuration writes (see
+# `Car.lock_config`); the second key is the car id.
+CONFIG_LOCK_NAMESPACE = 1
+# Entities of recently seen peer certificates, keyed by the SHA-256 of the DER
+# certificate, so that reconnecting clients are not parsed again either.
+ENTITY_CACHE = cryptolib.VerificationCache(maxsize=1024)
+# Parsed mechanic certificates, keyed by their id in mechanic_certificates.
+# Stored certificates never change, so entries only leave when evicted.
+MECHANIC_CERT_CACHE = cryptolib.VerificationCache(maxsize=1024)
+# Number of processes serving the car. With more than one, the car runs on the
+# pre-fork server (see `serve_prefork`) and keeps its state in the database.
+CAR_WORKERS = int(os.getenv("CAR_WORKERS", "1"))
+# Seconds an idle keep-alive connection is kept open for.
+KEEP_ALIVE_TIMEOUT = float(os.getenv("KEEP_ALIVE_TIMEOUT", "30"))
+# Server-side TLS handshakes, full and resumed.
+TLS_STATS = HandshakeStats()
+# Seconds between checks of the car's cache against the database, 0 to never
+# check (see `Car.check_cache`).
+CAR_CACHE_CHECK_INTERVAL = float(os.getenv("CAR_CACHE_CHECK_INTERVAL", "0"))
+# JSON file mapping the id of every car of a fleet to its owner's id. When set,
+# one server hosts all of them (see `FleetRouter`).
+CAR_FLEET = os.getenv("CAR_FLEET")
+# Seconds after its last request that a fleet car is dropped from memory, and
+# how many fleet cars are kept in memory at most.
+CAR_IDLE_TIMEOUT = float(os.getenv("CAR_IDLE_TIMEOUT", "600"))
+CAR_FLEET_SIZE = int(os.getenv("CAR_FLEET_SIZE", "10000"))
+# History rows fetched, and verified, per page read from the database.
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+# Connections shared by every car of the server.
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "10"))
 
 app = Flask(__name__)
 
@@ -35,31 +100,264 @@ class PeerCertWSGIRequestHandler(werkzeug.serving.WSGIRequestHandler):
 
     The output from that method is what we want to make available elsewhere
     in the application.
+
+    A handler instance lives as long as its connection, so the peer
+    certificate is parsed into an Entity on the first request only and
+    reused by every keep-alive request after it.
+
+    werkzeug's handler closes the connection after every response, so each
+    request would pay for a new TLS handshake. This one speaks HTTP/1.1 and
+    keeps connections open for KEEP_ALIVE_TIMEOUT seconds between requests.
     """
 
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+    entity = None
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without this, Nagle's
+        # algorithm holds the body back until the client's delayed ACK of the
+        # headers, adding ~40 ms to every request on a kept-alive connection.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        # The pre-fork server accepts connections without the TLS handshake
+        # (see `serve_worker`), so it runs here, in the connection's thread,
+        # bounded by `timeout`. It is a no-op if the server already did it.
+        try:
+            self.connection.do_handshake()
+        except OSError as e:
+            self.log_error("TLS handshake failed: %s", e)
+            return
+        TLS_STATS.record(self.connection.session_reused)
+        super().handle()
+
     def make_environ(self):
         """
         The superclass method develops the environ hash that eventually
         forms part of the Flask request object.
 
         We allow the superclass method to run first, then we insert the
-        peer certificate into the hash. That exposes it to us later in
-        the request variable that Flask provides
+        peer certificate and its Entity into the hash. That exposes them to
+        us later in the request variable that Flask provides
         """
         environ = super(PeerCertWSGIRequestHandler, self).make_environ()
-        x509_binary = self.connection.getpeercert(binary_form=True)
-
-        peer_cert = PKI.load_certificate(cert_binary=x509_binary)
-        environ["peercert"] = peer_cert
+        if self.entity is None:
+            x509_binary = self.connection.getpeercert(binary_form=True)
+            try:
+                self.entity = Entity.from_der(x509_binary)
+            except Exception:
+                # A certificate we cannot read an Entity from leaves the peer
+                # unknown: `verify_peer_cert` answers 403, rather than the
+                # connection being cut before any response.
+                pass
+
+        environ["peercert"] = self.entity.cert if self.entity else None
+        environ["entity"] = self.entity
+        environ["tls_server_name"] = getattr(self.connection, "tls_server_name", None)
         return environ
 
+    def keep_alive(self) -> bool:
+        """
+        Whether the connection can stay open after this request: the client
+        did not ask to close it, and the end of the request body is known
+        from its Content-Length.
+        """
+        return (
+            not self.close_connection
+            and "Transfer-Encoding" not in self.headers
+            and self.headers.get("Content-Length", "0").isdigit()
+        )
+
+    def run_wsgi(self):
+        """
+        Runs the app for one request. Requests that can keep the connection
+        open are served here, otherwise werkzeug serves the request and
+        closes the connection.
+
+        Unlike werkzeug, this does not drain whatever the client sent after
+        the request, since that is the next request. The unread part of the
+        request body is skipped instead.
+        """
+        if not self.keep_alive():
+            return super().run_wsgi()
+
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        self.environ = environ = self.make_environ()
+        body = werkzeug.wsgi.LimitedStream(
+            self.rfile, int(self.headers.get("Content-Length", "0"))
+        )
+        environ["wsgi.input"] = body
+        environ["wsgi.input_terminated"] = True
+
+        status_set = headers_set = None
+        headers_sent = False
+        chunked = False
+
+        def write(data: bytes) -> None:
+            nonlocal headers_sent, chunked
+            if not headers_sent:
+                headers_sent = True
+                code, _, msg = status_set.partition(" ")
+                code = int(code)
+                self.send_response(code, msg)
+                header_keys = set()
+                for key, value in headers_set:
+                    self.send_header(key, value)
+                    header_keys.add(key.lower())
+                chunked = not (
+                    "content-length" in header_keys
+                    or environ["REQUEST_METHOD"] == "HEAD"
+                    or 100 <= code < 200
+                    or code in (204, 304)
+                )
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                if self.close_connection:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+
+            if data:
+                if chunked:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                else:
+                    self.wfile.write(data)
+            self.wfile.flush()
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal status_set, headers_set
+            if exc_info and headers_sent:
+                raise exc_info[1].with_traceback(exc_info[2])
+            status_set, headers_set = status, headers
+            return write
+
+        def execute(wsgi_app) -> None:
+            application_iter = wsgi_app(environ, start_response)
+            try:
+                for data in application_iter:
+                    write(data)
+                if not headers_sent:
+                    write(b"")
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+            finally:
+                if hasattr(application_iter, "close"):
+                    application_iter.close()
+
+        try:
+            execute(self.server.app)
+            body.exhaust()
+        except werkzeug.serving.connection_dropped_errors as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            # The connection is in an unknown state, close it after this
+            # response, like werkzeug does.
+            self.close_connection = True
+            if self.server.passthrough_errors:
+                raise
+            if not headers_sent:
+                status_set = headers_set = None
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+            self.server.log("error", f"Error on request:\n{traceback.format_exc()}")
+
+
+def open_pool():
+    return ConnectionPool(
+        min_size=1,
+        max_size=PG_POOL_SIZE,
+        conninfo=PG_CONNSTRING,
+    )
+
 
 # Initialize the connection pool
-pool = ConnectionPool(
-    min_size=1,
-    max_size=10,
-    conninfo=PG_CONNSTRING,
-)
+pool = open_pool()
+
+# Columns of the signed rows of each table, as verified by `verify_firmwares`
+# and `verify_stored_tests`.
+FIRMWARE_COLUMNS = ["firmware", "signature"]
+TEST_COLUMNS = ["tests", "signature", "mechanic_cert_id"]
+
+# The (config, is_delta) rows of a user's latest configuration snapshot and of
+# the deltas stored after it, oldest first.
+CONFIG_CHAIN_QUERY = """
+    SELECT config, is_delta
+    FROM configurations
+    WHERE car_id = %(car_id)s
+    AND user_id = %(user_id)s
+    AND id >= COALESCE(
+        (
+            SELECT MAX(id)
+            FROM configurations
+            WHERE car_id = %(car_id)s
+            AND user_id = %(user_id)s
+            AND NOT is_delta
+        ),
+        0
+    )
+    ORDER BY id;
+    """
+CURRENT_FIRMWARE_QUERY = """
+    SELECT firmware, signature, verified
+    FROM firmwares
+    WHERE car_id = %(car_id)s
+    ORDER BY id DESC
+    LIMIT 1;
+    """
+LATEST_TEST_QUERY = """
+    SELECT tests, signature, verified, mechanic_cert_id
+    FROM mechanic_tests
+    WHERE car_id = %(car_id)s
+    ORDER BY id DESC
+    LIMIT 1;
+    """
+MECHANIC_CERTS_QUERY = """
+    SELECT id, certificate
+    FROM mechanic_certificates
+    WHERE id = ANY(%(ids)s);
+    """
+
+
+def history_page_query(table, columns, after_id=None):
+    """A page of the car's rows of `table`, newest first (see `Car.iter_history`)."""
+    return sql.SQL(
+        """
+        SELECT id, {columns}, verified
+        FROM {table}
+        WHERE car_id = %(car_id)s
+        {after}
+        ORDER BY id DESC
+        LIMIT %(limit)s;
+        """
+    ).format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        table=sql.Identifier(table),
+        after=sql.SQL("AND id < %(after_id)s" if after_id is not None else ""),
+    )
+
+
+def reverify_page_query(table, columns):
+    """A page of the car's rows of `table` after `last_id`, oldest first."""
+    return sql.SQL(
+        """
+        SELECT id, {columns}
+        FROM {table}
+        WHERE car_id = %(car_id)s
+        AND id > %(last_id)s
+        ORDER BY id
+        LIMIT %(limit)s;
+        """
+    ).format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        table=sql.Identifier(table),
+    )
 
 
 class Role(Enum):
@@ -69,9 +367,11 @@ class Role(Enum):
 
 class Entity:
     def __init__(self, cert):
+        self.cert = cert
         self.email = PKI.get_subject_email(cert)
         role_attr = PKI.get_san_custom_oid(cert, "1.2.3.4.1")
         carowner_attr = PKI.get_san_custom_oid(cert, "1.2.3.4.2")
+        self.role = None
         self.car_owner = None
         if role_attr:
             role_name = role_attr.removeprefix("motorist_role--")
@@ -79,39 +379,366 @@ class Entity:
         if carowner_attr:
             self.car_owner = carowner_attr.removeprefix("motorist_carowner--")
 
+    @classmethod
+    def from_der(cls, cert_der: bytes):
+        """
+        Returns the Entity of a DER certificate, from ENTITY_CACHE when the same
+        certificate was seen before and has not expired since.
+        """
+        now = datetime.now(timezone.utc)
+        fingerprint = hashlib.sha256(cert_der).digest()
+        entity = ENTITY_CACHE.lookup(fingerprint, now)
+        if entity is None:
+            cert = PKI.load_certificate(cert_binary=cert_der)
+            entity = cls(cert)
+            ENTITY_CACHE.store(fingerprint, entity, cert.not_valid_after_utc)
+        return entity
+
+
+class CarState:
+    """
+    Mutable state of a car, kept in this process. Used when a single process
+    serves the car.
+    """
+
+    DEFAULTS = {
+        "battery_level": 100,
+        "op_count": 0,
+        "maintenance_mode": False,
+        "mechanic_config": {},
+        "encrypted_car_key": None,
+    }
+
+    def __init__(self, car_id):
+        self.car_id = car_id
+        self._values = copy.deepcopy(self.DEFAULTS)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            return self._values[name]
+
+    def set(self, **values):
+        with self._lock:
+            self._values.update(values)
+
+    def record_operation(self):
+        """Counts an operation; every 10 operations drain 5% of the battery."""
+        with self._lock:
+            self._values["op_count"] += 1
+            if self._values["op_count"] >= 10 and self._values["battery_level"] > 0:
+                self._values["op_count"] = 0
+                self._values["battery_level"] -= 5
+
+
+class SharedCarState(CarState):
+    """
+    Car state kept in the car_state table, so that every worker process of the
+    pre-fork server sees the same battery, maintenance mode and mechanic config.
+    Each update is a single statement, so concurrent workers do not lose any.
+    """
+
+    def reset(self):
+        """Stores the state of a freshly started car."""
+        values = {**self.DEFAULTS, "car_id": self.car_id}
+        values["mechanic_config"] = json.dumps(values["mechanic_config"])
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO car_state (car_id, battery_level, op_count,
+                            maintenance_mode, mechanic_config, encrypted_car_key)
+                        VALUES (%(car_id)s, %(battery_level)s, %(op_count)s,
+                            %(maintenance_mode)s, %(mechanic_config)s,
+                            %(encrypted_car_key)s)
+                        ON CONFLICT (car_id) DO UPDATE SET
+                            battery_level = EXCLUDED.battery_level,
+                            op_count = EXCLUDED.op_count,
+                            maintenance_mode = EXCLUDED.maintenance_mode,
+                            mechanic_config = EXCLUDED.mechanic_config,
+                            encrypted_car_key = EXCLUDED.encrypted_car_key;
+                        """,
+                        values,
+                    )
+                conn.commit()
+        except Exception as e:
+            print("ERR_G15")
+            raise (e)
+
+    def ensure(self):
+        """Stores the state of a freshly started car, unless it has one already."""
+        values = {**self.DEFAULTS, "car_id": self.car_id}
+        values["mechanic_config"] = json.dumps(values["mechanic_config"])
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO car_state (car_id, battery_level, op_count,
+                            maintenance_mode, mechanic_config, encrypted_car_key)
+                        VALUES (%(car_id)s, %(battery_level)s, %(op_count)s,
+                            %(maintenance_mode)s, %(mechanic_config)s,
+                            %(encrypted_car_key)s)
+                        ON CONFLICT (car_id) DO NOTHING;
+                        """,
+                        values,
+                    )
+                conn.commit()
+        except Exception as e:
+            print("ERR_G19")
+            raise (e)
+
+    def get(self, name):
+        if name not in self.DEFAULTS:
+            raise KeyError(name)
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        sql.SQL(
+                            "SELECT {} FROM car_state WHERE car_id = %(car_id)s;"
+                        ).format(sql.Identifier(name)),
+                        {"car_id": self.car_id},
+                    )
+                    return cur.fetchone()[0]
+        except Exception as e:
+            print("ERR_G16")
+            raise (e)
+
+    def set(self, **values):
+        for name in values:
+            if name not in self.DEFAULTS:
+                raise KeyError(name)
+        if "mechanic_config" in values:
+            values["mechanic_config"] = json.dumps(values["mechanic_config"])
+        assignments = sql.SQL(", ").join(
+            sql.SQL("{} = {}").format(sql.Identifier(name), sql.Placeholder(name))
+            for name in values
+        )
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        sql.SQL(
+                            "UPDATE car_state SET {} WHERE car_id = %(car_id)s;"
+                        ).format(assignments),
+                        {**values, "car_id": self.car_id},
+                    )
+                conn.commit()
+        except Exception as e:
+            print("ERR_G17")
+            raise (e)
+
+    def record_operation(self):
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        UPDATE car_state SET
+                            op_count = CASE
+                                WHEN op_count + 1 >= 10 AND battery_level > 0 THEN 0
+                                ELSE op_count + 1
+                            END,
+                            battery_level = CASE
+                                WHEN op_count + 1 >= 10 AND battery_level > 0
+                                THEN battery_level - 5
+                                ELSE battery_level
+                            END
+                        WHERE car_id = %(car_id)s;
+                        """,
+                        {"car_id": self.car_id},
+                    )
+                conn.commit()
+        except Exception as e:
+            print("ERR_G18")
+            raise (e)
+
+
+def verify_firmwares(firmwares, conn=None) -> list:
+    """
+    Returns the (verified, signer fingerprint) of each (firmware, signature):
+    whether the manufacturer signed it. Needs no database access, so `conn`
+    is unused (see `verify_stored_tests`).
+    """
+    verified = PKI.verify_many(
+        (MANUFACTURER_CERT, firmware, signature) for firmware, signature in firmwares
+    )
+    return [
+        (firmware_verified, MANUFACTURER_FINGERPRINT) for firmware_verified in verified
+    ]
+
+
+def issued_by_root_ca(cert) -> bool:
+    """
+    Whether the CA signed `cert`. Its validity period is not checked: tests
+    signed while the certificate was valid stay verified after it expires.
+    """
+    try:
+        cert.verify_directly_issued_by(CA.root_ca)
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+    return True
+
+
+def verify_tests(tests) -> list:
+    """
+    Returns the (verified, signer fingerprint) of each (tests, signature,
+    mechanic certificate): whether the mechanic signed them, with a
+    certificate issued by the CA.
+    """
+    verified = PKI.verify_many(
+        (cert, str(test), signature) for test, signature, cert in tests
+    )
+    return [
+        (
+            test_verified and issued_by_root_ca(cert),
+            cert.fingerprint(hashes.SHA256()).hex(),
+        )
+        for (_, _, cert), test_verified in zip(tests, verified)
+    ]
+
+
+def load_mechanic_certs(cert_ids, conn=None) -> dict:
+    """
+    Returns the mechanic certificates of `cert_ids` by id, from
+    MECHANIC_CERT_CACHE when they were parsed before. The others are read
+    through `conn` when given, else through a pooled connection.
+    """
+    now = datetime.now(timezone.utc)
+    certs = {}
+    missing = []
+    for cert_id in set(cert_ids):
+        cert = MECHANIC_CERT_CACHE.lookup(cert_id, now)
+        if cert is None:
+            missing.append(cert_id)
+        else:
+            certs[cert_id] = cert
+    if not missing:
+        return certs
+    with pool.connection() if conn is None else contextlib.nullcontext(conn) as conn:
+        with conn.cursor() as cur:
+            cur.execute(MECHANIC_CERTS_QUERY, {"ids": missing})
+            rows = cur.fetchall()
+    for cert_id, pem in rows:
+        cert = x509.load_pem_x509_certificate(pem.encode("utf-8"))
+        MECHANIC_CERT_CACHE.store(
+            cert_id, cert, datetime.max.replace(tzinfo=timezone.utc)
+        )
+        certs[cert_id] = cert
+    return certs
+
+
+def verify_stored_tests(tests, conn=None) -> list:
+    """
+    `verify_tests` for stored (tests, signature, mechanic certificate id) rows.
+    Callers that hold a connection pass it as `conn`: taking a second one from
+    the pool while holding the first could wait forever once it runs out.
+    """
+    certs = load_mechanic_certs((cert_id for _, _, cert_id in tests), conn)
+    return verify_tests(
+        [(test, signature, certs[cert_id]) for test, signature, cert_id in tests]
+    )
+
+
+class LatestCache:
+    """
+    Write-through cache of the latest configuration, firmware and tests of the
+    car. A car process is the only writer of its tables, so its writes update
+    the cache and reads are answered from memory; only the first read of an
+    entry, or one after `invalidate`, loads it from the database.
+
+    A disabled cache loads every read, for when several processes write the
+    same tables (the pre-fork server).
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._values = {}
+        # Bumped by every write, so a load that raced with one is not cached.
+        self._generations = collections.Counter()
+        self._lock = threading.Lock()
+
+    def get(self, name, load):
+        """Returns the cached `name`, or caches and returns `load()`."""
+        with self._lock:
+            if name in self._values:
+                self.hits += 1
+                return self._values[name]
+            self.misses += 1
+            generation = self._generations[name]
+        value = load()
+        with self._lock:
+            if self.enabled and generation == self._generations[name]:
+                self._values[name] = value
+        return value
+
+    def put(self, name, value) -> None:
+        """Records `value` as just written to the database."""
+        with self._lock:
+            self._generations[name] += 1
+            if self.enabled:
+                self._values[name] = value
+
+    def invalidate(self, *names) -> None:
+        """Drops `names`, or every entry, so their next read loads them."""
+        with self._lock:
+            for name in names or list(self._values):
+                self._values.pop(name, None)
+                self._generations[name] += 1
+
+    def check(self, loaders: dict) -> list:
+        """
+        Reloads every cached entry with its loader in `loaders`, replaces the
+        ones that differ from the database and returns their names.
+        """
+        stale = []
+        for name, load in loaders.items():
+            with self._lock:
+                if name not in self._values:
+                    continue
+                cached = self._values[name]
+                generation = self._generations[name]
+            value = load()
+            with self._lock:
+                if generation == self._generations[name] and value != cached:
+                    self._values[name] = value
+                    stale.append(name)
+        return stale
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": sorted(self._values),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
 
 class Car:
-    def __init__(self, default_config, car_id, owner_id=None):
-        self.maintenance_mode = False
+    def __init__(self, default_config, car_id, owner_id=None, state=None, cache=True):
+        self.state = state if state is not None else CarState(car_id)
+        self.cache = LatestCache(enabled=cache)
         self.config = {}
-        self.mechanic_config = {}
         self.firmware = {}
         self.id = car_id
         self.user_id = owner_id
-        self.battery_level = 100
-        self.op_count = 0
         self.car_name = f"car{car_id}"
         self.key_store = f"{Common.KEY_STORE}/{self.car_name}-web"
-        self.car_key = None
+        # (encrypted, decrypted) car key last seen by this process
+        self._car_key = (None, None)
         self.initialized = False
         self.default_config = default_config
         print(f"DEBUG: {self.key_store}")
 
         firmware = None
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT firmware
-                        FROM firmwares
-                        WHERE car_id = %(car_id)s
-                        ORDER BY id DESC
-                        LIMIT 1;
-                        """,
-                        {"car_id": self.id},
-                    )
-                    firmware = cur.fetchone()
+            firmware = self.cache.get("firmware", self.load_current_firmware)
         except Exception as e:
             print("ERR_G1")
             raise (e)
@@ -137,41 +764,65 @@ class Car:
         if self.car_key:
             self.complete_init()
 
+    @property
+    def battery_level(self):
+        return self.state.get("battery_level")
+
+    @property
+    def op_count(self):
+        return self.state.get("op_count")
+
+    @property
+    def maintenance_mode(self):
+        return self.state.get("maintenance_mode")
+
+    @property
+    def mechanic_config(self):
+        return self.state.get("mechanic_config")
+
+    @property
+    def car_key(self):
+        encrypted_car_key = self.state.get("encrypted_car_key")
+        if encrypted_car_key is None:
+            return None
+        if self._car_key[0] != encrypted_car_key:
+            # Another worker received a new key
+            self._car_key = (
+                encrypted_car_key,
+                PKI.decrypt_data(encrypted_car_key, f"{self.key_store}/key.priv"),
+            )
+        return self._car_key[1]
+
+    def set_car_key(self, encrypted_car_key):
+        """Stores the car key sent by the owner, encrypted to the car's certificate."""
+        car_key = PKI.decrypt_data(encrypted_car_key, f"{self.key_store}/key.priv")
+        self._car_key = (encrypted_car_key, car_key)
+        self.state.set(encrypted_car_key=encrypted_car_key)
+
     def complete_init(self):
         # if there is a config in the database, use that
         config = None
 
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT config
-                        FROM configurations
-                        WHERE car_id = %(car_id)s
-                        AND user_id = %(user_id)s
-                        ORDER BY id DESC
-                        LIMIT 1;
-                        """,
-                        {"car_id": self.id, "user_id": self.user_id},
-                    )
-                    config = cur.fetchone()
+            config = self.cache.get("config", self.load_current_config)
         except Exception as e:
             print("ERR_G2")
             raise (e)
         # existent config was found
         if config:
-            self.config = config[0]
+            self.config = config
             print("Config from DB", self.config)
         # no config found, use default
         else:
             with open(self.default_config, "r") as file:
                 self.config = json.load(file)
                 print("Default Config", self.config)
+                # Split so that later deltas merge without decrypting it.
                 config_protected = cryptolib.protect_lib(
                     self.config,
                     f"{self.car_key}",
                     ["configuration"],
+                    envelope="split",
                 )
                 print("Default Config", config_protected)
                 self.store_update(json.dumps(config_protected["configuration"]))
@@ -187,10 +838,22 @@ class Car:
             "config": config,
         }
 
+    def lock_config(self, cur):
+        """
+        Holds the car's configuration lock until the transaction ends. Pre-fork
+        workers store updates of the same car, and a snapshot must include
+        every delta stored before it.
+        """
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(%(namespace)s, %(car_id)s);",
+            {"namespace": CONFIG_LOCK_NAMESPACE, "car_id": int(self.id)},
+        )
+
     def store_update(self, config):
         try:
             with pool.connection() as conn:
                 with conn.cursor() as cur:
+                    self.lock_config(cur)
                     cur.execute(
                         """
                         INSERT INTO configurations (car_id, user_id, config)
@@ -206,15 +869,232 @@ class Car:
         except Exception as e:
             print("ERR_G3")
             raise (e)
+        self.cache.put("config", json.loads(config))
+
+    def store_delta(self, delta):
+        """
+        Appends a configuration delta (see `cryptolib.protect_delta`), and a
+        rebuilt snapshot once CONFIG_SNAPSHOT_INTERVAL deltas have piled up
+        since the last one.
+        """
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    self.lock_config(cur)
+                    cur.execute(
+                        """
+                        INSERT INTO configurations (car_id, user_id, config, is_delta)
+                        VALUES (%(car_id)s, %(user_id)s, %(config)s, TRUE);
+                        """,
+                        {
+                            "car_id": self.id,
+                            "user_id": self.user_id,
+                            "config": json.dumps(delta),
+                        },
+                    )
+                    chain = self.load_config_chain(cur)
+                    config = self.rebuild_config(chain)
+                    if (
+                        sum(is_delta for _, is_delta in chain)
+                        >= CONFIG_SNAPSHOT_INTERVAL
+                    ):
+                        cur.execute(
+                            """
+                            INSERT INTO configurations (car_id, user_id, config)
+                            VALUES (%(car_id)s, %(user_id)s, %(config)s);
+                            """,
+                            {
+                                "car_id": self.id,
+                                "user_id": self.user_id,
+                                "config": json.dumps(config),
+                            },
+                        )
+                conn.commit()
+        except Exception as e:
+            print("ERR_G14")
+            raise (e)
+        self.cache.put("config", config)
+
+    def load_config_chain(self, cur):
+        """
+        Returns the (config, is_delta) rows of the latest configuration snapshot
+        and of the deltas stored after it, oldest first.
+        """
+        cur.execute(CONFIG_CHAIN_QUERY, {"car_id": self.id, "user_id": self.user_id})
+        return cur.fetchall()
+
+    def rebuild_config(self, chain):
+        """Applies the deltas of a configuration chain to its snapshot."""
+        config = None
+        for row_config, is_delta in chain:
+            if is_delta:
+                config = cryptolib.merge_delta(config, row_config, self.car_key)
+            else:
+                config = row_config
+        return config
+
+    def load_current_config(self):
+        """Rebuilds the current configuration from the database."""
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                return self.rebuild_config(self.load_config_chain(cur))
+
+    def load_current_firmware(self):
+        """Returns the (firmware, signature, verified) last installed, or None."""
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(CURRENT_FIRMWARE_QUERY, {"car_id": self.id})
+                firmware = cur.fetchone()
+        if firmware and firmware[2] is None:
+            # Stored before signature statuses were, and not re-verified yet.
+            firmware = (*firmware[:2], verify_firmwares([firmware[:2]])[0][0])
+        return firmware
+
+    def load_latest_test(self):
+        """Returns the (tests, signature, verified) last run, or None."""
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LATEST_TEST_QUERY, {"car_id": self.id})
+                tests = cur.fetchone()
+        if not tests:
+            return None
+        verified = tests[2]
+        if verified is None:
+            verified = verify_stored_tests([(tests[0], tests[1], tests[3])])[0][0]
+        return (tests[0], tests[1], verified)
+
+    def invalidate_cache(self, *names):
+        """
+        Drops the cached `names` ("config", "firmware", "tests"), or all of
+        them, e.g. after the car's tables were changed by another process.
+        """
+        self.cache.invalidate(*names)
+
+    def check_cache(self):
+        """
+        Compares the cache with the database, reloading the entries that
+        differ. Returns their names; with a single writer, there are none.
+        """
+        return self.cache.check(
+            {
+                "config": self.load_current_config,
+                "firmware": self.load_current_firmware,
+                "tests": self.load_latest_test,
+            }
+        )
+
+    def reverify(self) -> int:
+        """
+        Verifies the signatures of the car's firmwares and tests stored since
+        the last run again, and stores their statuses. When the trust anchors
+        changed since, it verifies all of them. Returns how many rows it
+        verified.
+        """
+        verified = self.reverify_table(
+            "firmwares", FIRMWARE_COLUMNS, verify_firmwares
+        ) + self.reverify_table(
+            "mechanic_tests",
+            TEST_COLUMNS,
+            verify_stored_tests,
+        )
+        if verified:
+            self.cache.invalidate("firmware", "tests")
+        return verified
+
+    def reverify_table(self, table, columns, verify) -> int:
+        """
+        Re-verifies the rows of `table` after its watermark, a batch at a time,
+        see `reverify`. The watermark moves after each batch, so an interrupted
+        run resumes where it stopped.
+        """
+        select = reverify_page_query(table, columns)
+        update = sql.SQL(
+            """
+            UPDATE {table}
+            SET verified = %s, signer_fingerprint = %s, verified_at = NOW()
+            WHERE id = %s;
+            """
+        ).format(table=sql.Identifier(table))
+        params = {"car_id": self.id, "table": table, "anchors": TRUST_ANCHORS}
+        verified = 0
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT last_id, trust_anchors
+                        FROM verification_watermarks
+                        WHERE car_id = %(car_id)s AND table_name = %(table)s;
+                        """,
+                        params,
+                    )
+                    watermark = cur.fetchone()
+                    last_id = 0
+                    if watermark and watermark[1] == TRUST_ANCHORS:
+                        last_id = watermark[0]
+
+                    while True:
+                        cur.execute(
+                            select,
+                            {**params, "last_id": last_id, "limit": HISTORY_BATCH_SIZE},
+                        )
+                        rows = cur.fetchall()
+                        if rows:
+                            statuses = verify([row[1:] for row in rows], conn)
+                            cur.executemany(
+                                update,
+                                [
+                                    (row_verified, signer_fingerprint, row[0])
+                                    for row, (row_verified, signer_fingerprint) in zip(
+                                        rows, statuses
+                                    )
+                                ],
+                            )
+                            last_id = rows[-1][0]
+                            verified += len(rows)
+                        cur.execute(
+                            """
+                            INSERT INTO verification_watermarks
+                                (car_id, table_name, last_id, trust_anchors)
+                            VALUES (%(car_id)s, %(table)s, %(last_id)s, %(anchors)s)
+                            ON CONFLICT (car_id, table_name) DO UPDATE SET
+                                last_id = EXCLUDED.last_id,
+                                trust_anchors = EXCLUDED.trust_anchors;
+                            """,
+                            {**params, "last_id": last_id},
+                        )
+                        conn.commit()
+                        if len(rows) < HISTORY_BATCH_SIZE:
+                            break
+        except Exception as e:
+            print("ERR_G20")
+            raise (e)
+        return verified
 
     def store_tests(self, tests, signature, mechanic_cert):
+        # Verified once, here; reads use the stored status.
+        verified, signer_fingerprint = verify_tests(
+            [(json.loads(tests), signature, mechanic_cert)]
+        )[0]
         try:
             with pool.connection() as conn:
                 with conn.cursor() as cur:
+                    # A mechanic's certificate is stored once, and referenced
+                    # by every test they sign.
                     cur.execute(
                         """
-                        INSERT INTO mechanic_tests (car_id, tests, signature, timestamp, mechanic_cert)
-                        VALUES (%(car_id)s, %(tests)s, %(signature)s, NOW(), %(mechanic_cert)s);
+                        WITH cert AS (
+                            INSERT INTO mechanic_certificates (fingerprint, certificate)
+                            VALUES (%(signer_fingerprint)s, %(mechanic_cert)s)
+                            ON CONFLICT (fingerprint) DO UPDATE
+                            SET fingerprint = EXCLUDED.fingerprint
+                            RETURNING id
+                        )
+                        INSERT INTO mechanic_tests (car_id, tests, signature, timestamp, mechanic_cert_id,
+                            verified, signer_fingerprint, verified_at)
+                        SELECT %(car_id)s, %(tests)s, %(signature)s, NOW(), cert.id,
+                            %(verified)s, %(signer_fingerprint)s, NOW()
+                        FROM cert;
                         """,
                         {
                             "car_id": self.id,
@@ -223,34 +1103,24 @@ class Car:
                             "mechanic_cert": mechanic_cert.public_bytes(
                                 encoding=serialization.Encoding.PEM
                             ).decode("utf-8"),
+                            "verified": verified,
+                            "signer_fingerprint": signer_fingerprint,
                         },
                     )
                 conn.commit()
         except Exception as e:
             print("ERR_G4")
             raise (e)
+        self.cache.put("tests", (json.loads(tests), signature, verified))
 
     def get_current_config(self):
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT config
-                        FROM configurations
-                        WHERE car_id = %(car_id)s
-                        AND user_id = %(user_id)s
-                        ORDER BY id DESC
-                        LIMIT 1;
-                        """,
-                        {"car_id": self.id, "user_id": self.user_id},
-                    )
-                    config = cur.fetchone()
+            config = self.cache.get("config", self.load_current_config)
 
             protected_car_config = {
                 "carId": self.id,
                 "user": self.user_id,
-                "configuration": config[0],
+                "configuration": config,
             }
             print("Protected Config", protected_car_config)
             return json.dumps(protected_car_config)
@@ -271,14 +1141,16 @@ class Car:
                 with conn.cursor() as cur:
                     cur.execute(
                         """
-                        INSERT INTO firmwares (car_id, firmware, signature, timestamp)
-                        VALUES (%(car_id)s, %(firmware)s, %(signature)s, NOW());
+                        INSERT INTO firmwares (car_id, firmware, signature, timestamp,
+                            verified, signer_fingerprint, verified_at)
+                        VALUES (%(car_id)s, %(firmware)s, %(signature)s, NOW(),
+                            TRUE, %(signer_fingerprint)s, NOW());
                         """,
                         {
                             "car_id": self.id,
                             "firmware": firmware,
                             "signature": signature,
-                            "timestamp": "NOW()",
+                            "signer_fingerprint": MANUFACTURER_FINGERPRINT,
                         },
                     )
                 conn.commit()
@@ -287,31 +1159,15 @@ class Car:
         except Exception as e:
             print("ERR_G6")
             raise (e)
+        self.cache.put("firmware", (firmware, signature, True))
 
         return "Firmware Updated Successfully"
 
     def get_current_firmware(self):
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT firmware, signature, timestamp
-                        FROM firmwares
-                        WHERE car_id = %(car_id)s
-                        ORDER BY id DESC
-                        LIMIT 1;
-                        """,
-                        {"car_id": self.id},
-                    )
-                    firmware = cur.fetchone()
+            firmware = self.cache.get("firmware", self.load_current_firmware)
 
-            protected_firmware = {
-                "firmware": firmware[0],
-                "verified": PKI.verify_signature(
-                    MANUFACTURER_CERT, firmware[0], firmware[1]
-                ),
-            }
+            protected_firmware = {"firmware": firmware[0], "verified": firmware[2]}
             print("Protected Firmware", protected_firmware)
             return json.dumps(protected_firmware)
 
@@ -319,30 +1175,62 @@ class Car:
             print("ERR_G7")
             raise (e)
 
-    def get_all_and_verify_firmware(self):
-        try:
+    def iter_history(self, table, columns, verify, after_id=None, limit=None):
+        """
+        Yields (row, verified) for the car's rows of `table`, newest first: at
+        most `limit` of them, and only those older than the row `after_id`
+        when given (keyset pagination). Rows hold the id, then `columns`.
+
+        Signature statuses are stored with the rows. `verify(rows, conn)` (see
+        `verify_firmwares`) checks, a page at a time, those without one. It
+        reads through the connection of the page, if it needs to.
+
+        Rows are read a page of `HISTORY_BATCH_SIZE` at a time, each page on a
+        pooled connection held only while it is read, so the first rows are
+        ready before the last ones are read, memory does not grow with the
+        history, and a slow reader does not keep a connection.
+        """
+        while limit is None or limit > 0:
+            page_size = HISTORY_BATCH_SIZE
+            if limit is not None:
+                page_size = min(limit, page_size)
             with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT firmware, signature, timestamp
-                        FROM firmwares
-                        WHERE car_id = %(car_id)s
-                        ORDER BY id DESC;
-                        """,
-                        {"car_id": self.id},
-                    )
-                    firmwares = cur.fetchall()
-
-            protected_firmwares = []
-            for firmware in firmwares:
-                protected_firmware = {
-                    "firmware": firmware[0],
-                    "verified": PKI.verify_signature(
-                        MANUFACTURER_CERT, firmware[0], firmware[1]
-                    ),
-                }
-                protected_firmwares.append(protected_firmware)
+                rows = conn.execute(
+                    history_page_query(table, columns, after_id),
+                    {"car_id": self.id, "after_id": after_id, "limit": page_size},
+                ).fetchall()
+                unverified = [row[1:-1] for row in rows if row[-1] is None]
+                statuses = iter(verify(unverified, conn) if unverified else [])
+            for row in rows:
+                verified = row[-1]
+                if verified is None:
+                    verified = next(statuses)[0]
+                yield row[:-1], verified
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+            if limit is not None:
+                limit -= len(rows)
+
+    def iter_firmware_history(self, after_id=None, limit=None):
+        """Yields the car's verified firmwares, newest first (see `iter_history`)."""
+        rows = self.iter_history(
+            "firmwares",
+            FIRMWARE_COLUMNS,
+            verify_firmwares,
+            after_id,
+            limit,
+        )
+        for firmware, firmware_verified in rows:
+            yield {
+                "id": firmware[0],
+                "firmware": firmware[1],
+                "verified": firmware_verified,
+            }
+
+    def get_all_and_verify_firmware(self, after_id=None, limit=None):
+        try:
+            protected_firmwares = list(self.iter_firmware_history(after_id, limit))
             print("Protected Firmwares", protected_firmwares)
             return json.dumps(protected_firmwares)
 
@@ -352,31 +1240,12 @@ class Car:
 
     def get_latest_test(self):
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT tests, signature, mechanic_cert
-                        FROM mechanic_tests
-                        WHERE car_id = %(car_id)s
-                        ORDER BY id DESC
-                        LIMIT 1;
-                        """,
-                        {"car_id": self.id},
-                    )
-                    tests = cur.fetchone()
+            tests = self.cache.get("tests", self.load_latest_test)
 
             if not tests:
                 return "No tests found"
 
-            protected_tests = {
-                "tests": str(tests[0]),
-                "verified": PKI.verify_signature(
-                    x509.load_pem_x509_certificate(tests[2].encode("utf-8")),
-                    str(tests[0]),
-                    tests[1],
-                ),
-            }
+            protected_tests = {"tests": str(tests[0]), "verified": tests[2]}
             print("Protected Tests", protected_tests)
             return json.dumps(protected_tests)
 
@@ -384,35 +1253,25 @@ class Car:
             print("ERR_G9")
             raise (e)
 
-    def get_all_and_verify_tests(self):
+    def iter_tests_history(self, after_id=None, limit=None):
+        """Yields the car's verified tests, newest first (see `iter_history`)."""
+        rows = self.iter_history(
+            "mechanic_tests",
+            TEST_COLUMNS,
+            verify_stored_tests,
+            after_id,
+            limit,
+        )
+        for test, test_verified in rows:
+            yield {"id": test[0], "tests": str(test[1]), "verified": test_verified}
+
+    def get_all_and_verify_tests(self, after_id=None, limit=None):
         try:
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT tests, signature, mechanic_cert
-                        FROM mechanic_tests
-                        WHERE car_id = %(car_id)s
-                        ORDER BY id DESC;
-                        """,
-                        {"car_id": self.id},
-                    )
-                    tests = cur.fetchall()
+            protected_tests = list(self.iter_tests_history(after_id, limit))
 
-            if tests == []:
+            if protected_tests == [] and after_id is None:
                 return "No tests found"
 
-            protected_tests = []
-            for test in tests:
-                protected_test = {
-                    "tests": str(test[0]),
-                    "verified": PKI.verify_signature(
-                        x509.load_pem_x509_certificate(test[2].encode("utf-8")),
-                        str(test[0]),
-                        test[1],
-                    ),
-                }
-                protected_tests.append(protected_test)
             print("Protected Tests", protected_tests)
             return json.dumps(protected_tests)
 
@@ -421,6 +1280,169 @@ class Car:
             raise (e)
 
 
+class CarRegistry:
+    """
+    Cars of a fleet served by one process. A car is created by `factory` on
+    its first request and dropped once idle for `idle_timeout` seconds, or when
+    `maxsize` more recently used cars are in memory. Dropping a car loses
+    nothing: fleet cars keep their state in the database.
+    """
+
+    def __init__(self, factory, idle_timeout: float, maxsize: int):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.maxsize = maxsize
+        self.created = 0
+        self.evicted = 0
+        # car id -> [car, time of its last request], least recently used first
+        self._cars = collections.OrderedDict()
+        # car id -> lock held while that car is created
+        self._creating = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, car_id):
+        entry = self._cars.get(car_id)
+        if entry is None:
+            return None
+        entry[1] = time.monotonic()
+        self._cars.move_to_end(car_id)
+        return entry[0]
+
+    def get(self, car_id):
+        """
+        Returns the car `car_id`, creating it if needed. Raises KeyError for
+        cars that are not part of the fleet.
+        """
+        with self._lock:
+            found = self._lookup(car_id)
+            if found is not None:
+                return found
+            creating = self._creating.setdefault(car_id, threading.Lock())
+
+        # Only one thread creates a car; the others wait for it.
+        with creating:
+            with self._lock:
+                found = self._lookup(car_id)
+                if found is not None:
+                    return found
+            try:
+                created = self.factory(car_id)
+            finally:
+                with self._lock:
+                    self._creating.pop(car_id, None)
+            with self._lock:
+                self._cars[car_id] = [created, time.monotonic()]
+                self.created += 1
+                while len(self._cars) > self.maxsize:
+                    self._cars.popitem(last=False)
+                    self.evicted += 1
+            return created
+
+    def cars(self) -> list:
+        with self._lock:
+            return [entry[0] for entry in self._cars.values()]
+
+    def evict_idle(self) -> int:
+        """Drops the cars idle for longer than idle_timeout; returns how many."""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = 0
+        with self._lock:
+            while self._cars:
+                car_id, (_, last_used) = next(iter(self._cars.items()))
+                if last_used > deadline:
+                    break
+                del self._cars[car_id]
+                evicted += 1
+            self.evicted += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        return {
+            "cars": len(self._cars),
+            "maxsize": self.maxsize,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+class FleetRouter:
+    """
+    WSGI middleware of a fleet server. Routes /cars/<car_id>/<route> to
+    <route> for car <car_id>. Requests over a TLS connection whose server
+    name (SNI) is car<car_id>.<domain> go to that car's <route> as well.
+    Requests for no car only reach the debug endpoints.
+    """
+
+    PATH_PREFIX = re.compile(r"^/cars/(?P<car_id>\d+)(?=/|$)")
+    SERVER_NAME = re.compile(r"^car(?P<car_id>\d+)\.")
+    # Car ids are INTEGER columns in the database.
+    MAX_CAR_ID = 2**31 - 1
+
+    def __init__(self, wsgi_app, registry: CarRegistry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def car_id(self, environ):
+        path = environ.get("PATH_INFO", "")
+        match = self.PATH_PREFIX.match(path)
+        if match:
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + match[0]
+            environ["PATH_INFO"] = path[len(match[0]) :] or "/"
+            return match["car_id"]
+        match = self.SERVER_NAME.match(environ.get("tls_server_name") or "")
+        if match:
+            return match["car_id"]
+        return None
+
+    def __call__(self, environ, start_response):
+        car_id = self.car_id(environ)
+        if car_id is not None and int(car_id) > self.MAX_CAR_ID:
+            car_id = None
+        if car_id is not None:
+            try:
+                environ["car"] = self.registry.get(car_id)
+            except KeyError:
+                car_id = None
+        if car_id is None and not environ.get("PATH_INFO", "").startswith("/debug/"):
+            start_response("404 NOT FOUND", [("Content-Type", "text/plain")])
+            return [b"Unknown car"]
+        return self.wsgi_app(environ, start_response)
+
+
+# The car of a single-car server, served when a request names none.
+default_car = None
+# The fleet of a fleet server (see `FleetRouter`).
+registry = None
+
+
+def current_car():
+    """The car the current request is for, else the default car."""
+    if has_request_context():
+        return request.environ.get("car", default_car)
+    return default_car
+
+
+car = LocalProxy(current_car)
+
+
+def served_cars():
+    """Every car this process has in memory."""
+    if registry is not None:
+        return registry.cars()
+    return [default_car] if default_car is not None else []
+
+
+@app.before_request
+def verify_peer_cert():
+    """
+    Validates the client's certificate chain on every request. The results
+    are cached (see `PKI.verify_client_cert`), so this costs a lookup.
+    """
+    peercert = request.environ["peercert"]
+    if peercert is None or not CA.verify_client_cert(peercert)[0]:
+        return "Invalid client certificate", 403
+
+
 @app.route("/")
 def root():
     if not car.car_key:
@@ -430,12 +1452,11 @@ def root():
 
 @app.route("/set-car-key", methods=["POST"])
 def set_car_key():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to change maintenance mode", 403
     data = request.get_json()
-    encrypted_car_key = data["key"]
-    car.car_key = PKI.decrypt_data(encrypted_car_key, f"{car.key_store}/key.priv")
+    car.set_car_key(data["key"])
     if not car.initialized:
         car.complete_init()
     return "Car key set successfully"
@@ -446,7 +1467,7 @@ def run_tests():
     if not car.maintenance_mode:
         return "Maintenance Mode is off", 401
 
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.Mechanic:
         return "User not authorized to change the mechanic config", 403
 
@@ -469,22 +1490,21 @@ def run_tests():
 
 @app.route("/maintenance-mode/<mode>")
 def maintenance_mode(mode):
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not (entity.role == Role.User) and not (entity.car_owner == car.id):
         return "User not authorized to change maintenance mode", 403
 
     if not car.car_key:
         return "Not allowed without a key", 503
     if mode == "on":
-        car.maintenance_mode = True
         # set car config to default
         with open(car.default_config, "r") as file:
-            car.mechanic_config["configuration"] = json.load(file)["configuration"]
-        print("Default Config", car.mechanic_config)
+            mechanic_config = {"configuration": json.load(file)["configuration"]}
+        car.state.set(maintenance_mode=True, mechanic_config=mechanic_config)
+        print("Default Config", mechanic_config)
 
     elif mode == "off":
-        car.mechanic_config = {}
-        car.maintenance_mode = False
+        car.state.set(maintenance_mode=False, mechanic_config={})
     else:
         return "Invalid mode"
     return f"Maintenance mode is {mode}"
@@ -494,7 +1514,7 @@ def maintenance_mode(mode):
 def update_config():
     if not car.car_key:
         return "Not allowed without a key", 503
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to change maintenance mode", 403
     data = request.get_json()
@@ -503,16 +1523,19 @@ def update_config():
 
     try:
         # store the update protected
-        car.store_update(json.dumps(data["configuration"]))
+        if data.get("delta"):
+            delta = data["configuration"]
+            if not isinstance(delta, dict) or SPLIT_FIELD not in delta:
+                return "Invalid configuration delta", 400
+            car.store_delta(delta)
+        else:
+            car.store_update(json.dumps(data["configuration"]))
 
     except Exception as e:
         print("ERR_G12")
-        return f"Error2: {e}"
+        return f"Error2: {e}", 500
 
-    car.op_count += 1
-    if car.op_count >= 10 and car.battery_level > 0:
-        car.op_count = 0
-        car.battery_level -= 5
+    car.state.record_operation()
 
     return "Config Updated Sucessfully"
 
@@ -520,7 +1543,7 @@ def update_config():
 @app.route("/update-mechanic-config", methods=["POST"])
 def update_mechanic_config():
     # Authenticate the user
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.Mechanic:
         return "User not authorized to change the mechanic config", 403
 
@@ -532,7 +1555,7 @@ def update_mechanic_config():
 
     try:
         config = data["configuration"]
-        car.mechanic_config["configuration"] = config
+        car.state.set(mechanic_config={"configuration": config})
         return "Config Updated Sucessfully"
 
     except Exception as e:
@@ -543,7 +1566,7 @@ def update_mechanic_config():
 @app.route("/get-mechanic-config")
 def get_mechanic_config():
     # Authenticate the user
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.Mechanic:
         return "User not authorized to change the mechanic config", 403
 
@@ -554,7 +1577,7 @@ def get_mechanic_config():
 
 @app.route("/get-config")
 def get_config():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to get config", 403
     if not car.car_key:
@@ -568,7 +1591,7 @@ def get_config():
 
 @app.route("/check-battery")
 def check_battery():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to check battery", 403
     if not car.car_key:
@@ -578,19 +1601,18 @@ def check_battery():
 
 @app.route("/charge-battery")
 def charge_battery():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to charge battery", 403
     if not car.car_key:
         return "Not allowed without a key", 503
-    car.battery_level = 100
-    car.op_count = 0
+    car.state.set(battery_level=100, op_count=0)
     return "Battery has been charged to 100%"
 
 
 @app.route("/check-firmware")
 def check_firmware():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to check firmware", 403
     if not car.car_key:
@@ -598,19 +1620,57 @@ def check_firmware():
     return car.get_current_firmware()
 
 
+def history_page():
+    """
+    The (after_id, limit) of a history request: its rows are the `limit`
+    newest ones older than the row `after_id`. Both are optional; the next
+    page starts after the id of the last row of this one.
+    """
+    after_id = request.args.get("after_id")
+    limit = request.args.get("limit")
+    after_id = int(after_id) if after_id is not None else None
+    limit = int(limit) if limit is not None else None
+    if limit is not None and limit < 0:
+        raise ValueError("negative limit")
+    return after_id, limit
+
+
+def history_response(rows, error_code):
+    """
+    Streams `rows` as NDJSON, one verified row per line, as soon as each is
+    ready. The rows are read lazily, so an error can only end the stream.
+    """
+
+    def lines():
+        try:
+            for row in rows:
+                yield json.dumps(row) + "\n"
+        except Exception:
+            print(error_code)
+            raise
+
+    return Response(lines(), mimetype="application/x-ndjson")
+
+
 @app.route("/verify-firmware-history")
 def verify_firmware_history():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to check firmware history", 403
     if not car.car_key:
         return "Not allowed without a key", 503
-    return car.get_all_and_verify_firmware()
+    try:
+        after_id, limit = history_page()
+    except ValueError:
+        return "Invalid page", 400
+    if request.args.get("format") == "ndjson":
+        return history_response(car.iter_firmware_history(after_id, limit), "ERR_G8")
+    return car.get_all_and_verify_firmware(after_id, limit)
 
 
 @app.route("/check-tests")
 def check_tests():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to check tests", 403
     if not car.car_key:
@@ -620,22 +1680,84 @@ def check_tests():
 
 @app.route("/verify-tests-history")
 def verify_tests_history():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.User or not entity.car_owner == car.id:
         return "User not authorized to check tests history", 403
     if not car.car_key:
         return "Not allowed without a key", 503
-    return car.get_all_and_verify_tests()
+    try:
+        after_id, limit = history_page()
+    except ValueError:
+        return "Invalid page", 400
+    if request.args.get("format") == "ndjson":
+        return history_response(car.iter_tests_history(after_id, limit), "ERR_G10")
+    return car.get_all_and_verify_tests(after_id, limit)
 
 
 # DEBUG ENDPOINTS
 @app.route("/debug/get-doc")
 def get_car_document():
+    if not car:
+        return "Unknown car", 404
     if not car.car_key:
         return "Not allowed without a key", 503
     return json.dumps(car.build_car_document(car.config))
 
 
+def is_owner_or_mechanic(entity) -> bool:
+    """Whether `entity` is a mechanic, or the owner of the car of the request."""
+    return entity.role == Role.Mechanic or (
+        entity.role == Role.User and bool(car) and entity.car_owner == car.id
+    )
+
+
+@app.route("/debug/cache-stats")
+def cache_stats():
+    if not is_owner_or_mechanic(request.environ["entity"]):
+        return "User not authorized to see the cache statistics", 403
+    return json.dumps(
+        {
+            "verify_signature": PKI.verification_cache.stats(),
+            "entities": ENTITY_CACHE.stats(),
+            "mechanic_certificates": MECHANIC_CERT_CACHE.stats(),
+            "car": car.cache.stats() if car else None,
+            "fleet": registry.stats() if registry else None,
+        }
+    )
+
+
+@app.route("/debug/reverify", methods=["POST"])
+def reverify():
+    if not is_owner_or_mechanic(request.environ["entity"]):
+        return "User not authorized to re-verify signatures", 403
+    if not car:
+        return "Unknown car", 404
+    return json.dumps({"verified": car.reverify()})
+
+
+@app.route("/debug/invalidate-cache", methods=["POST"])
+def invalidate_cache():
+    if not is_owner_or_mechanic(request.environ["entity"]):
+        return "User not authorized to invalidate the cache", 403
+    if not car:
+        return "Unknown car", 404
+    car.invalidate_cache(*request.args.getlist("name"))
+    return "Cache invalidated"
+
+
+@app.route("/debug/tls-stats")
+def tls_stats():
+    # Handshakes of clients with this process, and of this process with the
+    # manufacturer.
+    manufacturer_context = req.get_adapter(Common.MANUFACTURER_URL).ssl_context
+    return json.dumps(
+        {
+            "server": TLS_STATS.stats(),
+            "manufacturer": manufacturer_context.handshake_stats.stats(),
+        }
+    )
+
+
 @app.route("/debug/whoami")
 def whoami():
     return str(request.environ["peercert"])
@@ -643,7 +1765,7 @@ def whoami():
 
 @app.route("/update-firmware", methods=["POST"])
 def update_firmware():
-    entity = Entity(request.environ["peercert"])
+    entity = request.environ["entity"]
     if not entity.role == Role.Mechanic:
         return "User not authorized to update firmware", 403
     try:
@@ -666,9 +1788,231 @@ if not default_config_path:
     raise ValueError("DEFAULT_CONFIG_PATH environment variable not set")
 
 
+def watch_cache(interval: float):
+    """Checks the car's cache against the database every `interval` seconds."""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            for served in served_cars():
+                try:
+                    stale = served.check_cache()
+                except Exception:
+                    traceback.print_exc()
+                    continue
+                if stale:
+                    print(
+                        f"Cache of {', '.join(stale)} of car {served.id} was stale, "
+                        "reloaded it"
+                    )
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def watch_fleet(interval: float):
+    """Drops the fleet's idle cars every `interval` seconds."""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            registry.evict_idle()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def fleet_car_factory(owners: dict):
+    """Creates the fleet's cars, with their state in the database."""
+
+    def create(car_id):
+        # Unknown cars must not leave a state row behind.
+        if car_id not in owners:
+            raise KeyError(car_id)
+        state = SharedCarState(car_id)
+        state.ensure()
+        created = Car(
+            default_config_path, car_id, owners[car_id], state, cache=CAR_WORKERS == 1
+        )
+        if REVERIFY_INTERVAL > 0:
+            # Catch up with trust anchor changes made while the car was not
+            # loaded, in the background rather than in its first request.
+            loaded_cars.put(created)
+        return created
+
+    return create
+
+
+def remember_server_name(ssl_socket, server_name, ssl_context):
+    """SNI callback keeping the server name on the connection, for `FleetRouter`."""
+    ssl_socket.tls_server_name = server_name
+
+
+# Fleet cars loaded since they were last re-verified (see `watch_verification`).
+loaded_cars = queue.Queue()
+
+
+def watch_verification(interval: float):
+    """
+    Runs `Car.reverify` on the served cars now, then every `interval` seconds,
+    and on each fleet car as soon as it is loaded.
+    """
+
+    def reverify(served):
+        try:
+            verified = served.reverify()
+        except Exception:
+            traceback.print_exc()
+            return
+        if verified:
+            print(f"Re-verified {verified} signatures of car {served.id}")
+
+    def run():
+        next_run = time.monotonic()
+        while True:
+            if time.monotonic() >= next_run:
+                for served in served_cars():
+                    reverify(served)
+                next_run = time.monotonic() + interval
+            try:
+                served = loaded_cars.get(timeout=max(next_run - time.monotonic(), 0))
+            except queue.Empty:
+                continue
+            reverify(served)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def start_jobs():
+    """
+    Starts the periodic jobs of the server. Threads do not survive a fork, so
+    each pre-fork worker starts its own.
+    """
+    if registry is not None:
+        watch_fleet(max(CAR_IDLE_TIMEOUT / 2, 1))
+    if CAR_WORKERS == 1 and CAR_CACHE_CHECK_INTERVAL > 0:
+        watch_cache(CAR_CACHE_CHECK_INTERVAL)
+    if REVERIFY_INTERVAL > 0:
+        watch_verification(REVERIFY_INTERVAL)
+
+
+def serve_worker(port: int, ssl_context):
+    """Runs one worker of the pre-fork server, see `serve_prefork`."""
+    global pool
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    pool = open_pool()
+    start_jobs()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind(("0.0.0.0", port))
+    listener.listen(128)
+
+    server = werkzeug.serving.make_server(
+        "0.0.0.0",
+        port,
+        app,
+        threaded=True,
+        request_handler=PeerCertWSGIRequestHandler,
+        fd=listener.fileno(),
+    )
+    # werkzeug would handshake in the accept loop, where one slow client holds
+    # up every other connection of the worker. Defer it to the handler thread.
+    server.socket = ssl_context.wrap_socket(
+        server.socket, server_side=True, do_handshake_on_connect=False
+    )
+    server.ssl_context = ssl_context
+    server.serve_forever()
+
+
+def serve_prefork(workers: int, port: int, ssl_context):
+    """
+    Serves the app from `workers` forked processes. Each worker listens on its
+    own SO_REUSEPORT socket, so the kernel spreads connections across them,
+    and serves them with threads and the mutual TLS request handler. A worker
+    that dies is replaced; SIGINT / SIGTERM stop them all.
+    """
+    # Neither pooled connections nor their threads survive a fork, so the
+    # workers open their own.
+    pool.close()
+    req.close()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                serve_worker(port, ssl_context)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on port {port} with {workers} workers")
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited, restarting it")
+            time.sleep(1)
+            spawn()
+
+
 def start():
-    global car
-    car = Car(default_config_path, sys.argv[1], sys.argv[2])
+    global default_car, registry
+    try:
+        for version in migrate(pool, MIGRATIONS_DIR):
+            print(f"Applied schema migration {version}")
+    except Exception as e:
+        print("ERR_G21")
+        raise (e)
+
+    if CAR_FLEET:
+        with open(CAR_FLEET, "r") as file:
+            owners = {str(car_id): owner for car_id, owner in json.load(file).items()}
+        registry = CarRegistry(
+            fleet_car_factory(owners), CAR_IDLE_TIMEOUT, CAR_FLEET_SIZE
+        )
+        app.wsgi_app = FleetRouter(app.wsgi_app, registry)
+        server_key_store = os.getenv(
+            "CAR_SERVER_KEY_STORE", f"{Common.KEY_STORE}/car-fleet-web"
+        )
+    else:
+        state = None
+        if CAR_WORKERS > 1:
+            state = SharedCarState(sys.argv[1])
+            state.reset()
+        # Pre-fork workers write the same tables, so none of them can cache.
+        default_car = Car(
+            default_config_path,
+            sys.argv[1],
+            sys.argv[2],
+            state,
+            cache=CAR_WORKERS == 1,
+        )
+        server_key_store = default_car.key_store
     # set different port for car based on id
     port = Common.CAR_PORT
 
@@ -683,12 +2027,24 @@ def start():
     # load in the certificate and private key for our server to provide to clients.
     # force the client to provide a certificate.
     ssl_context.load_cert_chain(
-        certfile=f"{car.key_store}/entity.crt",
-        keyfile=f"{car.key_store}/key.priv",
+        certfile=f"{server_key_store}/entity.crt",
+        keyfile=f"{server_key_store}/key.priv",
         password="",
     )
     ssl_context.verify_mode = ssl.CERT_REQUIRED
-
+    # Hand out session tickets, so that returning clients resume their session
+    # instead of repeating the whole mutual TLS handshake. The ticket keys are
+    # created with the context, so pre-fork workers accept each other's tickets.
+    ssl_context.options &= ~ssl.OP_NO_TICKET
+    ssl_context.num_tickets = 2
+    if registry is not None:
+        ssl_context.sni_callback = remember_server_name
+
+    if CAR_WORKERS > 1:
+        serve_prefork(CAR_WORKERS, int(port), ssl_context)
+        return
+
+    start_jobs()
     app.run(
         host="0.0.0.0",
         port=port,
@@ -1,9 +1,106 @@
 import requests
+import ssl
 import sys
 import os
+import threading
+from requests.adapters import HTTPAdapter
 from cryptolib import PKI
 
 
+class HandshakeStats:
+    """Counts TLS handshakes, and how many of them resumed an earlier session."""
+
+    def __init__(self):
+        self.handshakes = 0
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+    def record(self, resumed: bool) -> None:
+        with self._lock:
+            self.handshakes += 1
+            self.resumed += resumed
+
+    def stats(self) -> dict:
+        return {
+            "handshakes": self.handshakes,
+            "resumed": self.resumed,
+            "resumed_ratio": self.resumed / self.handshakes if self.handshakes else 0.0,
+        }
+
+
+class SessionResumingSocket(ssl.SSLSocket):
+    """
+    SSLSocket that hands the session the server gave it to its context, so
+    the next connection to that server resumes it. With TLS 1.3, the session
+    ticket arrives after the handshake, with the first response.
+    """
+
+    _session_key = None
+
+    def recv_into(self, buffer, nbytes=None, flags=0):
+        received = super().recv_into(buffer, nbytes, flags)
+        if self._session_key is not None:
+            session = self.session
+            if session is not None and session.has_ticket:
+                self.context.sessions[self._session_key] = session
+                self._session_key = None
+        return received
+
+
+class SessionResumingContext(ssl.SSLContext):
+    """
+    Client SSLContext that keeps the last session of each server it connects
+    to, and offers it on the next handshake with that server. A resumed
+    handshake skips the certificate exchange and signatures of a full one.
+    """
+
+    sslsocket_class = SessionResumingSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, *args, **kwargs):
+        self.sessions = {}
+        self.handshake_stats = HandshakeStats()
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        key = (server_hostname, sock.getpeername())
+        if session is None:
+            session = self.sessions.get(key)
+        ssl_sock = super().wrap_socket(
+            sock, *args, server_hostname=server_hostname, session=session, **kwargs
+        )
+        self.handshake_stats.record(ssl_sock.session_reused)
+        ssl_sock._session_key = key
+        return ssl_sock
+
+
+class TLSContextAdapter(HTTPAdapter):
+    """
+    Transport adapter that connects with an SSLContext loaded up front, and
+    keeps using it for every connection, so that sessions can be resumed.
+    The context replaces the session's `verify` and `cert`.
+    """
+
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, _ = super().build_connection_pool_key_attributes(
+            request, verify, cert
+        )
+        return host_params, {"ssl_context": self.ssl_context}
+
+    def cert_verify(self, conn, url, verify, cert):
+        # The context already holds the trust store and the client chain. Left
+        # on the pool, urllib3 would load them into it again on every new
+        # connection.
+        super().cert_verify(conn, url, verify, cert)
+        conn.ca_certs = conn.ca_cert_dir = None
+        conn.cert_file = conn.key_file = None
+
+
 class Common:
     PROJECT_ROOT = os.getenv("PROJECT_ROOT", "../../")
     KEY_STORE = os.getenv("KEY_STORE", f"{PROJECT_ROOT}/key_store")
@@ -17,15 +114,31 @@ class Common:
     )
 
     @staticmethod
-    def get_tls_session():
+    def build_tls_session(ca_path, cert_path=None, key_path=None):
+        """
+        Session that verifies servers against `ca_path`, authenticates with
+        `cert_path` / `key_path` when given, keeps connections alive and
+        resumes TLS sessions on reconnect.
+        """
+        ssl_context = SessionResumingContext()
+        ssl_context.load_verify_locations(cafile=ca_path)
+        if cert_path:
+            ssl_context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+
         s = requests.Session()
+        s.verify = ca_path
+        if cert_path:
+            s.cert = (cert_path, key_path)
+        s.mount("https://", TLSContextAdapter(ssl_context))
+        return s
 
+    @staticmethod
+    def get_tls_session():
         if not os.path.isfile(Common.ROOT_CA_PATH):
             print(f"FATAL ERROR: FILE {Common.ROOT_CA_PATH} does not exist!")
             sys.exit(1)
 
-        s.verify = Common.ROOT_CA_PATH
-        return s
+        return Common.build_tls_session(Common.ROOT_CA_PATH)
 
     @staticmethod
     def get_mutual_tls_session(entity_name):
@@ -41,8 +154,4 @@ class Common:
             if must_exit:
                 sys.exit(1)
 
-        s = requests.Session()
-        s.verify = Common.ROOT_CA_PATH
-        s.cert = (entity_crt, entity_key)
-
-        return s
+        return Common.build_tls_session(Common.ROOT_CA_PATH, entity_crt, entity_key)
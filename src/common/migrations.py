@@ -0,0 +1,60 @@
+import os
+import re
+
+# Migration files are named <version>_<name>.sql, e.g. 0002_history_indexes.sql.
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+# Key of the advisory lock held while migrating, so that servers starting
+# together do not apply the same migration twice.
+MIGRATION_LOCK = 7464
+
+
+def load_migrations(directory: str) -> list[tuple[int, str, str]]:
+    """Returns the (version, name, sql) of the migrations in `directory`, in order."""
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE.match(file_name)
+        if not match:
+            continue
+        with open(os.path.join(directory, file_name), "r") as file:
+            migrations.append((int(match[1]), match[2], file.read()))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def migrate(pool, directory: str) -> list[int]:
+    """
+    Upgrades the database in place: applies the migrations of `directory` that
+    `schema_migrations` does not list yet, in order, and records them there.
+    They are applied in one transaction, so a failed upgrade changes nothing.
+    Returns the versions applied.
+    """
+    applied = []
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK,))
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                );
+                """
+            )
+            cur.execute("SELECT version FROM schema_migrations;")
+            done = {version for (version,) in cur.fetchall()}
+            for version, name, migration in load_migrations(directory):
+                if version in done:
+                    continue
+                # Without parameters, a query may hold several statements.
+                cur.execute(migration)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                    (version, name),
+                )
+                applied.append(version)
+        conn.commit()
+    return applied
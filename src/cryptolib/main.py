@@ -1,17 +1,37 @@
 import click
+import codecs
+import collections
+import collections.abc
+import itertools
 import json
+import mmap
+import os
 import sys
+import threading
+import time
+import zlib
 from base64 import b64encode
 import base64
 import secrets
+import struct
 from rich import pretty
 from rich import print
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import (
+    ec,
+    ed25519,
+    padding,
+    rsa,
+    x25519,
+)
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
     load_pem_private_key,
     load_pem_public_key,
 )
@@ -32,16 +52,206 @@ def cli():
 EncryptionAlgo = ChaCha20Poly1305
 
 
+class KeyHandle:
+    """
+    Reference to a symmetric key loaded by a `Keyring`, holding a ready AEAD
+    object so callers can skip the key lookup altogether.
+    """
+
+    __slots__ = ("aead", "source")
+
+    def __init__(self, aead: EncryptionAlgo, source):
+        self.aead = aead
+        self.source = source
+
+    def __repr__(self):
+        # Never leak raw key material through the repr.
+        if isinstance(self.source, bytes):
+            return "KeyHandle(<raw key>)"
+        return f"KeyHandle({self.source!r})"
+
+
+class _KeyringEntry:
+    __slots__ = ("handle", "stamp", "checked", "last_used")
+
+    def __init__(self, handle: KeyHandle, stamp, now: float):
+        self.handle = handle
+        self.stamp = stamp
+        self.checked = now
+        self.last_used = now
+
+
+class Keyring:
+    """
+    In-process cache of symmetric keys.
+
+    Each key is read and decoded once, and the resulting AEAD object is reused
+    for every subsequent operation. Keys may be given as a path to a base64 key
+    file (as written by `generate-key`), as raw key bytes or as a `KeyHandle`.
+
+    Key files are re-read when their inode, mtime or size change (checked at
+    most every `check_interval` seconds), and keys that have not been used for
+    `idle_timeout` seconds are evicted.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0, check_interval: float = 1.0):
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def load(self, key) -> KeyHandle:
+        """
+        Returns the handle for the given key, loading it if needed.
+
+        Args:
+            key (str | os.PathLike | bytes | KeyHandle): key file path, raw key
+                bytes or an existing handle
+
+        Returns:
+            KeyHandle: handle with a ready AEAD object
+        """
+        if isinstance(key, KeyHandle):
+            return key
+
+        now = time.monotonic()
+        is_raw = isinstance(key, (bytes, bytearray))
+        cache_key = bytes(key) if is_raw else os.path.abspath(os.fspath(key))
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.stamp is not None:
+                if now - entry.checked >= self.check_interval:
+                    if Keyring._stamp(cache_key) != entry.stamp:
+                        entry = None
+                    else:
+                        entry.checked = now
+            if entry is None:
+                stamp = None if is_raw else Keyring._stamp(cache_key)
+                entry = _KeyringEntry(Keyring._build(cache_key, stamp), stamp, now)
+                self._entries[cache_key] = entry
+            entry.last_used = now
+
+            if now - self._last_sweep >= self.idle_timeout:
+                self._sweep(now)
+            return entry.handle
+
+    def aead(self, key) -> EncryptionAlgo:
+        """Returns the AEAD object for the given key."""
+        return self.load(key).aead
+
+    def evict(self, key) -> None:
+        """Drops a key from the keyring, if present."""
+        if isinstance(key, KeyHandle):
+            key = key.source
+        if isinstance(key, (bytes, bytearray)):
+            key = bytes(key)
+        else:
+            key = os.path.abspath(os.fspath(key))
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _sweep(self, now: float) -> None:
+        idle = [
+            cache_key
+            for cache_key, entry in self._entries.items()
+            if now - entry.last_used >= self.idle_timeout
+        ]
+        for cache_key in idle:
+            del self._entries[cache_key]
+        self._last_sweep = now
+
+    @staticmethod
+    def _stamp(path: str) -> tuple:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _build(cache_key, stamp) -> KeyHandle:
+        if stamp is None:
+            return KeyHandle(EncryptionAlgo(cache_key), cache_key)
+
+        with open(cache_key, "r", encoding="utf-8") as key_file:
+            key_bytes = base64.b64decode(key_file.read().strip())
+        return KeyHandle(EncryptionAlgo(key_bytes), cache_key)
+
+
+# Process-wide keyring used by protect_lib / unprotect_lib / decrypt.
+KEYRING = Keyring()
+
+# Compression applied to a serialized field before it is sealed:
+#   name -> (envelope id, compress(data, level), decompress(data))
+# Only zlib ships with the standard library; another codec (e.g. zstd) plugs in
+# here once it is a dependency.
+COMPRESSIONS = {"zlib": (1, zlib.compress, zlib.decompress)}
+COMPRESSION_IDS = {0: None, **{entry[0]: name for name, entry in COMPRESSIONS.items()}}
+# Smaller fields are sealed as they are: the deflate framing and the extra
+# envelope byte eat most of what compression saves on them.
+COMPRESSION_THRESHOLD = 256
+
+
+def compression_options(command):
+    command = click.option(
+        "--compression-level",
+        default=-1,
+        show_default=True,
+        help="Codec level, -1 for the codec default.",
+    )(command)
+    return click.option(
+        "--compression",
+        type=click.Choice(list(COMPRESSIONS)),
+        default=None,
+        help=f"Compress fields of {COMPRESSION_THRESHOLD}+ bytes before sealing.",
+    )(command)
+
+
+def _compress(plaintext: bytes, compression, level: int, threshold: int):
+    """Returns the plaintext to seal and the compression applied to it, if any."""
+    if compression is None or len(plaintext) < threshold:
+        return plaintext, None
+    compressed = COMPRESSIONS[compression][1](plaintext, level)
+    if len(compressed) >= len(plaintext):
+        return plaintext, None
+    return compressed, compression
+
+
+def _decompress(plaintext: bytes, compression) -> bytes:
+    if compression is None:
+        return plaintext
+    return COMPRESSIONS[compression][2](plaintext)
+
+
 @cli.command()
 @click.argument("input_file")
 @click.argument("dummy_key")
 @click.argument("output_file")
 @click.option("--target_fields", "-t", multiple=True, required=True)
+@click.option("--stream", is_flag=True, help="Process a JSONL / JSON array stream.")
+@click.option(
+    "--envelope",
+    type=click.Choice(["json", "compact", "document", "split"]),
+    default="json",
+    show_default=True,
+    help="Format of the protected fields.",
+)
+@compression_options
 def protect(
     input_file: str,
     dummy_key: str,
     output_file: str,
     target_fields: list[str],
+    stream: bool,
+    envelope: str,
+    compression: str,
+    compression_level: int,
 ) -> None:
     """
     Command that encrypts the target fields in the input JSON file and writes
@@ -52,21 +262,270 @@ def protect(
         dummy_key (str): key file to be used for encryption
         output_file (str): output file to write the encrypted data
         target_fields (list[str]): json fields to be encrypted
+        stream (bool): treat the input as a stream of documents (JSON Lines or a
+            JSON array) and write one protected document per line
+        envelope (str): format of the protected fields, see `protect_lib`
+        compression (str): codec for fields above COMPRESSION_THRESHOLD, or None
+        compression_level (int): codec level
     """
+    options = {"compression": compression, "compression_level": compression_level}
+    if stream:
+        key = KEYRING.load(dummy_key)
+        stats = stream_records(
+            input_file,
+            output_file,
+            lambda record: protect_lib(record, key, target_fields, envelope, **options),
+        )
+        click.echo(stats.report(), err=True)
+        return
+
     with open(input_file, "r", encoding="utf-8") as file:
         data_dict = json.load(file)
 
-    encrypted_data_dict = protect_lib(data_dict, dummy_key, target_fields)
+    encrypted_data_dict = protect_lib(
+        data_dict, dummy_key, target_fields, envelope, **options
+    )
     print(f"Encrypted data: {encrypted_data_dict}")
 
     with open(output_file, "w", encoding="utf-8") as file:
         json.dump(encrypted_data_dict, file, indent=4, ensure_ascii=False)
 
 
+# Compact envelope: a single binary blob holding
+#   version (1 byte) | algorithm id (1 byte) | nonce | ciphertext
+# carried as an unpadded base64url string, or as raw bytes where the transport
+# allows it. The legacy envelope is a {"nonce", "ciphertext"} JSON object.
+# A compressed field is sealed in a version 2 envelope, which adds a flags byte
+# holding the compression id (see COMPRESSIONS):
+#   version (1 byte) | algorithm id (1 byte) | flags (1 byte) | nonce | ciphertext
+# and in the legacy envelope by a "compression" member.
+ENVELOPE_VERSION = 1
+ENVELOPE_VERSION_FLAGS = 2
+ENVELOPE_ALGORITHMS = {1: (EncryptionAlgo, 12)}  # id -> (AEAD, nonce size)
+ENVELOPE_ALGORITHM_ID = 1
+ENVELOPES = ("json", "compact", "raw", "document", "split")
+
+# Document envelope: all target fields serialized together as one JSON object
+# and sealed with a single AEAD call into a compact envelope, stored as
+#   {DOCUMENT_FIELD: {"fields": [...], "sealed": <base64url compact envelope>}}
+# The sealed field names and the DOCUMENT_HEADER values are the associated
+# data, so renaming a field or moving the blob to another car / user fails
+# authentication. The name is reserved: documents holding it cannot be sealed.
+DOCUMENT_FIELD = "__protected__"
+DOCUMENT_HEADER = ("carId", "user")
+
+# Split envelope: each top-level sub-field of a (dict) target field is sealed
+# on its own into a compact envelope, with the field and sub-field names as
+# associated data:
+#   {SPLIT_FIELD: {"ac": <compact envelope>, "tire_pressure": ...}}
+# A delta (`protect_delta`) has the same shape, holding only the changed
+# sub-fields plus a "removed" list, and `merge_delta` applies it to a split
+# value without decrypting anything.
+SPLIT_FIELD = "subfields"
+
+
+def seal_envelope(nonce: bytes, ciphertext: bytes, compression=None) -> bytes:
+    """Packs a nonce and ciphertext into a compact binary envelope."""
+    if compression is None:
+        header = bytes([ENVELOPE_VERSION, ENVELOPE_ALGORITHM_ID])
+    else:
+        flags = COMPRESSIONS[compression][0]
+        header = bytes([ENVELOPE_VERSION_FLAGS, ENVELOPE_ALGORITHM_ID, flags])
+    return header + nonce + ciphertext
+
+
+def open_envelope(value) -> tuple[bytes, bytes, str | None]:
+    """
+    Returns the (nonce, ciphertext, compression) stored in a protected field, in
+    any of the envelope formats.
+
+    Args:
+        value (dict | str | bytes): legacy JSON envelope, base64url compact
+            envelope or raw compact envelope
+
+    Raises:
+        ValueError: When the value is not a supported envelope
+    """
+    if isinstance(value, dict):
+        if "ciphertext" not in value or "nonce" not in value:
+            raise ValueError("Invalid envelope: missing nonce or ciphertext")
+        compression = value.get("compression")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError("Unsupported envelope compression: ", compression)
+        return (
+            base64.b64decode(value["nonce"]),
+            base64.b64decode(value["ciphertext"]),
+            compression,
+        )
+
+    if isinstance(value, str):
+        value = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    elif not isinstance(value, (bytes, bytearray)):
+        raise ValueError("Invalid envelope type: ", type(value).__name__)
+
+    if len(value) < 2 or value[0] not in (ENVELOPE_VERSION, ENVELOPE_VERSION_FLAGS):
+        raise ValueError("Unsupported envelope version")
+    if value[1] not in ENVELOPE_ALGORITHMS:
+        raise ValueError("Unsupported envelope algorithm: ", value[1])
+    _, nonce_size = ENVELOPE_ALGORITHMS[value[1]]
+
+    compression, offset = None, 2
+    if value[0] == ENVELOPE_VERSION_FLAGS:
+        if len(value) < 3 or value[2] not in COMPRESSION_IDS:
+            raise ValueError("Unsupported envelope flags")
+        compression, offset = COMPRESSION_IDS[value[2]], 3
+    return (
+        bytes(value[offset : offset + nonce_size]),
+        bytes(value[offset + nonce_size :]),
+        compression,
+    )
+
+
+def _document_aad(fields: list[str], document: dict) -> bytes:
+    header = [document.get(name) for name in DOCUMENT_HEADER]
+    return json.dumps([fields, header]).encode("utf-8")
+
+
+def _seal_document(
+    aead: EncryptionAlgo, data_dict: dict, target_fields, compress
+) -> dict:
+    if DOCUMENT_FIELD in data_dict:
+        raise ValueError(f"Field {DOCUMENT_FIELD} is reserved by the document envelope")
+    fields = [field for field in target_fields if field in data_dict]
+    plaintext, compression = compress(
+        json.dumps(
+            {field: data_dict.pop(field) for field in fields}, ensure_ascii=False
+        ).encode("utf-8")
+    )
+
+    nonce = secrets.token_bytes(12)
+    ciphertext = aead.encrypt(nonce, plaintext, _document_aad(fields, data_dict))
+    sealed = seal_envelope(nonce, ciphertext, compression)
+    data_dict[DOCUMENT_FIELD] = {
+        "fields": fields,
+        "sealed": base64.urlsafe_b64encode(sealed).rstrip(b"=").decode("ascii"),
+    }
+    return data_dict
+
+
+def _open_document(aead: EncryptionAlgo, encrypted_dict: dict) -> dict:
+    """Returns every field sealed in a document envelope."""
+    protected = encrypted_dict[DOCUMENT_FIELD]
+    if not isinstance(protected, dict) or "fields" not in protected:
+        raise ValueError("Invalid document envelope")
+
+    nonce, ciphertext, compression = open_envelope(protected.get("sealed"))
+    # The header never holds DOCUMENT_FIELD, so the AAD can be rebuilt in place.
+    aad = _document_aad(protected["fields"], encrypted_dict)
+    return json.loads(_decompress(aead.decrypt(nonce, ciphertext, aad), compression))
+
+
+def _split_aad(field: str, name: str) -> bytes:
+    return json.dumps([field, name]).encode("utf-8")
+
+
+def _seal_split(aead: EncryptionAlgo, field: str, value: dict, compress=None) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError("Only objects can be split: ", field)
+    subfields = {}
+    for name, subvalue in value.items():
+        plaintext = json.dumps(subvalue, ensure_ascii=False).encode("utf-8")
+        compression = None
+        if compress is not None:
+            plaintext, compression = compress(plaintext)
+        nonce = secrets.token_bytes(12)
+        ciphertext = aead.encrypt(nonce, plaintext, _split_aad(field, name))
+        sealed = seal_envelope(nonce, ciphertext, compression)
+        subfields[name] = base64.urlsafe_b64encode(sealed).rstrip(b"=").decode("ascii")
+    return {SPLIT_FIELD: subfields}
+
+
+def _open_split(aead: EncryptionAlgo, field: str, value: dict) -> dict:
+    decrypted = {}
+    for name, sealed in value[SPLIT_FIELD].items():
+        nonce, ciphertext, compression = open_envelope(sealed)
+        plaintext = aead.decrypt(nonce, ciphertext, _split_aad(field, name))
+        decrypted[name] = json.loads(_decompress(plaintext, compression))
+    return decrypted
+
+
+def _is_split(value) -> bool:
+    return isinstance(value, dict) and SPLIT_FIELD in value
+
+
+def protect_delta(
+    previous: dict, current: dict, key, field: str = "configuration"
+) -> dict:
+    """
+    Seals the top-level sub-fields of `current` that differ from `previous`,
+    in the split envelope format.
+
+    Args:
+        previous (dict): plaintext value of `field` the delta applies to
+        current (dict): new plaintext value of `field`
+        key (str | bytes | KeyHandle): key file, raw key or keyring handle
+        field (str): name of the protected field, bound into each sub-field
+
+    Returns:
+        dict: {SPLIT_FIELD: {...changed sub-fields}, "removed": [...]}, with an
+            empty SPLIT_FIELD when nothing but removals (or nothing) changed
+    """
+    changed = {
+        name: value
+        for name, value in current.items()
+        if name not in previous or previous[name] != value
+    }
+    delta = _seal_split(KEYRING.aead(key), field, changed)
+    removed = [name for name in previous if name not in current]
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def merge_delta(base, delta: dict, key=None, field: str = "configuration") -> dict:
+    """
+    Applies a delta from `protect_delta` to the protected value of `field`.
+
+    Split values are merged envelope by envelope, with no key needed. Any
+    other envelope is first decrypted and re-sealed as a split value, which
+    needs `key`.
+
+    Args:
+        base (dict | str | bytes | None): protected value of `field`, or None
+            when there is none yet
+        delta (dict): delta to apply
+        key (str | bytes | KeyHandle | None): key, only used for non-split bases
+        field (str): name of the protected field
+
+    Raises:
+        ValueError: When `base` is not split and no key was given
+
+    Returns:
+        dict: the merged split value
+    """
+    if base is None:
+        base = {SPLIT_FIELD: {}}
+    elif not _is_split(base):
+        if key is None:
+            raise ValueError("A key is needed to merge into field: ", field)
+        aead = KEYRING.aead(key)
+        base = _seal_split(aead, field, _decrypt_field(aead, {field: base}, field))
+
+    subfields = dict(base[SPLIT_FIELD])
+    subfields.update(delta[SPLIT_FIELD])
+    for name in delta.get("removed", ()):
+        subfields.pop(name, None)
+    return {SPLIT_FIELD: subfields}
+
+
 def protect_lib(
     data_dict: dict,
     dummy_key: str,
     target_fields: list[str],
+    envelope: str = "json",
+    compression: str | None = None,
+    compression_level: int = -1,
+    compression_threshold: int = COMPRESSION_THRESHOLD,
 ) -> dict:
     """
     Encrypts the target fields in the input dictionary and returns the encrypted
@@ -74,33 +533,65 @@ def protect_lib(
 
     Args:
         data_dict (dict): dictionary to be encrypted
-        dummy_key (str): key file to be used for encryption
+        dummy_key (str | bytes | KeyHandle): key file, raw key or keyring handle
+            to be used for encryption
         target_fields (list[str]): fields to be encrypted
+        envelope (str): "json" for the legacy {"nonce", "ciphertext"} object,
+            "compact" for a base64url compact envelope string, "raw" for the
+            compact envelope as bytes, "document" to seal all target fields
+            together in one AEAD call (see DOCUMENT_FIELD), or "split" to seal
+            each sub-field of the target fields on its own (see SPLIT_FIELD)
+        compression (str | None): codec from COMPRESSIONS applied to each
+            serialized field before sealing, recorded in the envelope. Off by
+            default: the ciphertext length then depends on the content
+        compression_level (int): codec level, -1 for the codec default
+        compression_threshold (int): fields shorter than this many bytes are
+            never compressed
 
     Returns:
         dict: the dictionary with the target fields encrypted
     """
+    if envelope not in ENVELOPES:
+        raise ValueError("Unknown envelope: ", envelope)
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: ", compression)
+
+    def compress(plaintext):
+        return _compress(
+            plaintext, compression, compression_level, compression_threshold
+        )
 
-    with open(dummy_key, "r", encoding="utf-8") as key_file:
-        dummy_key_bytes = base64.b64decode(key_file.read().strip())
-
-    nonce = secrets.token_bytes(12)
-
+    aead = KEYRING.aead(dummy_key)
+    if envelope == "document":
+        return _seal_document(aead, data_dict, target_fields, compress)
     for field in target_fields:
-        if field in data_dict:
-            value_to_encrypt = json.dumps(data_dict[field], ensure_ascii=False).encode(
-                "utf-8"
-            )
-
-            encrypted_value = EncryptionAlgo(dummy_key_bytes).encrypt(
-                nonce, value_to_encrypt, None
+        if field in data_dict and envelope == "split":
+            data_dict[field] = _seal_split(aead, field, data_dict[field], compress)
+        elif field in data_dict:
+            value_to_encrypt, compressed = compress(
+                json.dumps(data_dict[field], ensure_ascii=False).encode("utf-8")
             )
 
-            # Replace the original value with the encrypted value (Base64 encoded for storage)
-            data_dict[field] = {
-                "nonce": base64.b64encode(nonce).decode("utf-8"),
-                "ciphertext": base64.b64encode(encrypted_value).decode("utf-8"),
-            }
+            # Every field is sealed under the same key, so each one needs its
+            # own nonce. Envelopes store it next to the ciphertext.
+            nonce = secrets.token_bytes(12)
+            encrypted_value = aead.encrypt(nonce, value_to_encrypt, None)
+
+            if envelope == "json":
+                # Replace the original value with the encrypted value (Base64 encoded for storage)
+                data_dict[field] = {
+                    "nonce": base64.b64encode(nonce).decode("utf-8"),
+                    "ciphertext": base64.b64encode(encrypted_value).decode("utf-8"),
+                }
+                if compressed:
+                    data_dict[field]["compression"] = compressed
+            elif envelope == "compact":
+                sealed = seal_envelope(nonce, encrypted_value, compressed)
+                data_dict[field] = (
+                    base64.urlsafe_b64encode(sealed).rstrip(b"=").decode("ascii")
+                )
+            else:
+                data_dict[field] = seal_envelope(nonce, encrypted_value, compressed)
 
     return data_dict
 
@@ -110,11 +601,13 @@ def protect_lib(
 @click.argument("dummy_key")
 @click.argument("output_file")
 @click.option("--target_fields", "-t", multiple=True, required=True)
+@click.option("--stream", is_flag=True, help="Process a JSONL / JSON array stream.")
 def unprotect(
     input_file: str,
     dummy_key: str,
     output_file: str,
     target_fields: list[str],
+    stream: bool,
 ) -> None:
     """
     Command that decrypts the target fields in the input JSON file and writes
@@ -125,7 +618,18 @@ def unprotect(
         dummy_key (str): key file to be used for decryption
         output_file (str): output file to write the decrypted data
         target_fields (list[str]): json fields to be decrypted
+        stream (bool): treat the input as a stream of documents (JSON Lines or a
+            JSON array) and write one decrypted document per line
     """
+    if stream:
+        key = KEYRING.load(dummy_key)
+        stats = stream_records(
+            input_file,
+            output_file,
+            lambda record: decrypt(record, key, target_fields),
+        )
+        click.echo(stats.report(), err=True)
+        return
 
     with open(input_file, "r", encoding="utf-8") as file:
         encrypted_data_dict = json.load(file)
@@ -145,17 +649,15 @@ def unprotect_lib(
 
     Args:
         encrypted_dict (dict): dictionary to be decrypted
-        dummy_key (str): key file to be used for decryption
+        dummy_key (str | bytes | KeyHandle): key file, raw key or keyring handle
+            to be used for decryption
         target_fields (list[str]): fields to be decrypted
 
     Returns:
         dict: the dictionary with the target fields decrypted
     """
 
-    with open(dummy_key, "r", encoding="utf-8") as key_file:
-        dummy_key_bytes = base64.b64decode(key_file.read().strip())
-
-    data = decrypt(encrypted_dict, dummy_key_bytes, target_fields)
+    data = decrypt(encrypted_dict, dummy_key, target_fields)
     return data
 
 
@@ -165,9 +667,14 @@ def decrypt(encrypted_dict: dict, key_bytes: bytes, target_fields: list[str]) ->
 
     Args:
         encrypted_dict (dict): dictionary to be decrypted
-        key_bytes (bytes): key to be used for decryption
+        key_bytes (bytes | str | KeyHandle): raw key, key file or keyring handle
+            to be used for decryption
         target_fields (list[str]): fields to be decrypted
 
+    Fields may use the legacy JSON envelope or the compact one (as a base64url
+    string or raw bytes). A document envelope is opened in one call and all of
+    its fields are returned. Split fields are decrypted sub-field by sub-field.
+
     Raises:
         ValueError: When the field is not in the dictionary or the field is not encrypted
 
@@ -175,42 +682,147 @@ def decrypt(encrypted_dict: dict, key_bytes: bytes, target_fields: list[str]) ->
         dict: the dictionary with the target fields decrypted
     """
 
+    aead = KEYRING.aead(key_bytes)
     decrypted_dict = encrypted_dict.copy()
 
+    if DOCUMENT_FIELD in encrypted_dict:
+        fields = _open_document(aead, encrypted_dict)
+        for field in target_fields:
+            if field not in fields:
+                raise ValueError("Invalid arguments for field: ", field)
+        del decrypted_dict[DOCUMENT_FIELD]
+        decrypted_dict.update(fields)
+        return decrypted_dict
+
     for field in target_fields:
-        if not (
-            field in encrypted_dict
-            and isinstance(encrypted_dict[field], dict)
-            and "ciphertext" in encrypted_dict[field]
-            and "nonce" in encrypted_dict[field]
-        ):
-            raise ValueError("Invalid arguments for field: ", field)
+        decrypted_dict[field] = _decrypt_field(aead, encrypted_dict, field)
+
+    return decrypted_dict
+
 
-        stored_nonce = base64.b64decode(encrypted_dict[field]["nonce"])
-        stored_ciphertext = base64.b64decode(encrypted_dict[field]["ciphertext"])
+def _decrypt_field(aead: EncryptionAlgo, encrypted_dict: dict, field: str):
+    if field not in encrypted_dict:
+        raise ValueError("Invalid arguments for field: ", field)
+    if _is_split(encrypted_dict[field]):
+        return _open_split(aead, field, encrypted_dict[field])
 
-        decrypted_value = EncryptionAlgo(key_bytes).decrypt(
-            stored_nonce, stored_ciphertext, None
+    try:
+        stored_nonce, stored_ciphertext, compression = open_envelope(
+            encrypted_dict[field]
         )
-        print(f"Decrypted value for {field}:", json.loads(decrypted_value))
-        decrypted_dict[field] = json.loads(decrypted_value)
+    except ValueError:
+        raise ValueError("Invalid arguments for field: ", field)
 
-    return decrypted_dict
+    decrypted_value = aead.decrypt(stored_nonce, stored_ciphertext, None)
+    return json.loads(_decompress(decrypted_value, compression))
+
+
+class ProtectedDocument(collections.abc.Mapping):
+    """
+    Read-only view of a protected document that decrypts target fields lazily.
+
+    A target field is decrypted on first access and its plaintext is kept until
+    `drop` is called; other fields are read straight from the document. Callers
+    only pay for the protected fields they actually touch.
+
+    Example:
+        doc = ProtectedDocument(response.json(), key, ["configuration"])
+        doc["configuration"]["tire_pressure"]
+    """
+
+    def __init__(self, encrypted_dict: dict, key, target_fields: list[str]):
+        """
+        Args:
+            encrypted_dict (dict): protected document, as returned by protect_lib
+            key (str | bytes | KeyHandle): key file, raw key or keyring handle
+            target_fields (list[str]): protected fields of the document
+        """
+        self._document = encrypted_dict
+        self._aead = KEYRING.aead(key)
+        self._target_fields = frozenset(target_fields)
+        self._plaintext = {}
+
+    def __getitem__(self, field):
+        if field not in self._target_fields:
+            return self._document[field]
+        if field not in self._plaintext:
+            if DOCUMENT_FIELD in self._document:
+                # A document envelope can only be opened as a whole.
+                self._plaintext.update(_open_document(self._aead, self._document))
+                if field not in self._plaintext:
+                    raise ValueError("Invalid arguments for field: ", field)
+            else:
+                self._plaintext[field] = _decrypt_field(
+                    self._aead, self._document, field
+                )
+        return self._plaintext[field]
+
+    def __iter__(self):
+        if DOCUMENT_FIELD not in self._document:
+            return iter(self._document)
+        return itertools.chain(
+            (key for key in self._document if key != DOCUMENT_FIELD),
+            self._document[DOCUMENT_FIELD]["fields"],
+        )
+
+    def __len__(self):
+        if DOCUMENT_FIELD not in self._document:
+            return len(self._document)
+        return len(self._document) - 1 + len(self._document[DOCUMENT_FIELD]["fields"])
+
+    def is_decrypted(self, field) -> bool:
+        return field in self._plaintext
+
+    def drop(self, field=None) -> None:
+        """Forgets the plaintext of `field`, or of every field if None."""
+        if field is None:
+            self._plaintext.clear()
+        else:
+            self._plaintext.pop(field, None)
+
+    def to_dict(self) -> dict:
+        """Decrypts every target field, like `decrypt`."""
+        decrypted_dict = self._document.copy()
+        decrypted_dict.pop(DOCUMENT_FIELD, None)
+        for field in self._target_fields:
+            decrypted_dict[field] = self[field]
+        decrypted_dict.update(self._plaintext)
+        return decrypted_dict
 
 
 @cli.command()
 @click.argument("input_file")
 @click.argument("dummy_key")
 @click.option("--target_fields", "-t", multiple=True, required=True)
-def check(input_file: str, dummy_key: str, target_fields: list[str]) -> bool:
+@click.option("--stream", is_flag=True, help="Process a JSONL / JSON array stream.")
+def check(
+    input_file: str, dummy_key: str, target_fields: list[str], stream: bool
+) -> bool:
+    if stream:
+        key = KEYRING.load(dummy_key)
+        failed = []
+
+        def check_record(record):
+            try:
+                decrypt(record, key, target_fields)
+            except (InvalidTag, ValueError, KeyError, TypeError):
+                failed.append(stats.records)
+
+        stats = StreamStats()
+        stream_records(input_file, None, check_record, stats)
+        click.echo(stats.report(), err=True)
+        if failed:
+            shown = ", ".join(str(index) for index in failed[:10])
+            more = f" (and {len(failed) - 10} more)" if len(failed) > 10 else ""
+            print(f"Check for file {input_file} has failed for records: {shown}{more}")
+            click.get_current_context().exit(1)
+        return True
+
     try:
         with open(input_file, "r", encoding="utf-8") as file:
             encrypted_dict = json.load(file)
 
-        with open(dummy_key, "r", encoding="utf-8") as key_file:
-            dummy_key_bytes = base64.b64decode(key_file.read().strip())
-
-        decrypt(encrypted_dict, dummy_key_bytes, target_fields)
+        decrypt(encrypted_dict, dummy_key, target_fields)
         return True
 
     except InvalidTag:
@@ -221,6 +833,485 @@ def check(input_file: str, dummy_key: str, target_fields: list[str]) -> bool:
         return False
 
 
+class StreamStats:
+    """Record and byte counters for a streaming run."""
+
+    def __init__(self):
+        self.records = 0
+        self.bytes_in = 0
+        self.started = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.records} records, {self.bytes_in / 1e6:.2f} MB in {elapsed:.2f}s "
+            f"({self.records / elapsed:.0f} records/s, "
+            f"{self.bytes_in / 1e6 / elapsed:.2f} MB/s)"
+        )
+
+
+_JSON_WHITESPACE = " \t\r\n"
+# Characters that may continue a number cut at the end of the buffer.
+_JSON_NUMBER_TAIL = frozenset("0123456789.eE+-")
+# A parse error further than this from the end of the buffer cannot be fixed
+# by reading more: the longest token that can be cut short before it fails
+# (a literal such as -Infinity, or a \uXXXX escape) is shorter.
+_JSON_LOOKAHEAD = 16
+
+
+def _may_be_cut(buf: str, error: json.JSONDecodeError) -> bool:
+    """Whether `error` may only be due to a document cut at the end of `buf`."""
+    return (
+        error.msg.startswith("Unterminated string")
+        or len(buf) - error.pos <= _JSON_LOOKAHEAD
+    )
+
+
+def _is_complete(buf: str, end: int, record) -> bool:
+    """Whether a value decoded up to `end` cannot grow with more input."""
+    if end >= len(buf):
+        return False
+    is_number = isinstance(record, (int, float)) and not isinstance(record, bool)
+    return not (
+        is_number
+        and buf[end] in _JSON_NUMBER_TAIL
+        and len(buf) - end <= _JSON_LOOKAHEAD
+    )
+
+
+def iter_json_records(stream, stats: StreamStats = None, chunk_size: int = 1 << 16):
+    """
+    Incrementally parses JSON documents from a binary stream.
+
+    The stream may hold JSON Lines (or any whitespace separated documents) or a
+    single top-level JSON array, whose elements are yielded one by one. Only the
+    document being parsed is kept in memory.
+
+    Args:
+        stream (BinaryIO): stream to read from
+        stats (StreamStats): if given, counts the bytes read
+        chunk_size (int): least number of bytes read at a time
+
+    Raises:
+        json.JSONDecodeError: When the input is not valid JSON
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos = "", 0
+    in_array = None
+    # Inside an array: what comes next, "first" (a value or "]"), "value"
+    # (after a comma), "separator" (a comma or "]", after a value) or "end"
+    # (only whitespace, after the closing "]").
+    expect = "first"
+    eof = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in _JSON_WHITESPACE:
+            pos += 1
+
+        if pos < len(buf) and in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if pos < len(buf) and in_array:
+            if expect == "end":
+                raise json.JSONDecodeError("Extra data", buf, pos)
+            if buf[pos] == "]" and expect in ("first", "separator"):
+                pos += 1
+                expect = "end"
+                continue
+            if expect == "separator":
+                if buf[pos] != ",":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+                pos += 1
+                expect = "value"
+                continue
+            if buf[pos] in ",]":
+                raise json.JSONDecodeError("Expecting value", buf, pos)
+
+        if pos < len(buf):
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # Only a document cut at the end of the buffer may still
+                # parse once more data is in; anything else fails now.
+                if eof or not _may_be_cut(buf, e):
+                    raise
+            else:
+                # A value touching the end of the buffer may still be cut short
+                # (e.g. a number), so only trust it once more data is in.
+                if eof or _is_complete(buf, end, record):
+                    pos = end
+                    expect = "separator"
+                    yield record
+                    continue
+        elif eof:
+            if in_array and expect != "end":
+                raise json.JSONDecodeError("Unterminated array", buf, pos)
+            return
+
+        # What is left of the buffer is a document still being read. Read at
+        # least as much again, so that a document larger than a chunk is only
+        # re-parsed a logarithmic number of times, in linear time overall.
+        chunk = stream.read(max(chunk_size, len(buf) - pos))
+        if stats is not None:
+            stats.bytes_in += len(chunk)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+
+def stream_records(
+    input_file: str,
+    output_file: str,
+    process,
+    stats: StreamStats = None,
+) -> StreamStats:
+    """
+    Applies `process` to every document of the input stream and writes each
+    result as one JSON line, keeping memory use independent of the input size.
+
+    Args:
+        input_file (str): JSONL / JSON array file ("-" for stdin)
+        output_file (str): JSONL file to write ("-" for stdout), or None to
+            discard the results
+        process (Callable[[dict], dict]): function applied to each document
+        stats (StreamStats): counters to update, a new one is used by default
+
+    Returns:
+        StreamStats: the counters of the run
+    """
+    stats = stats if stats is not None else StreamStats()
+    with click.open_file(input_file, "rb") as source:
+        if output_file is None:
+            for record in iter_json_records(source, stats):
+                process(record)
+                stats.records += 1
+            return stats
+
+        with click.open_file(output_file, "w", encoding="utf-8") as sink:
+            for record in iter_json_records(source, stats):
+                sink.write(
+                    json.dumps(
+                        process(record), ensure_ascii=False, separators=(",", ":")
+                    )
+                )
+                sink.write("\n")
+                stats.records += 1
+    return stats
+
+
+def _check_lib(encrypted_dict: dict, dummy_key, target_fields: list[str]) -> None:
+    decrypt(encrypted_dict, dummy_key, target_fields)
+
+
+BULK_OPERATIONS = {
+    "protect": protect_lib,
+    "unprotect": decrypt,
+    "check": _check_lib,
+}
+
+# Per-record errors that are collected instead of aborting a bulk run: bad tags,
+# malformed envelopes / JSON / base64 (all ValueError) and missing fields.
+BULK_RECORD_ERRORS = (InvalidTag, ValueError, KeyError, TypeError)
+
+
+class BulkReport:
+    """Outcome of a bulk run: processed record count and per-record failures."""
+
+    def __init__(self):
+        self.records = 0
+        self.failures = []
+
+    def add_failure(self, index: int, error: Exception) -> None:
+        self.failures.append((index, f"{type(error).__name__}: {error}".rstrip(": ")))
+
+
+def _bulk_chunk(
+    operation: str, dummy_key, target_fields, options: dict, start: int, documents
+):
+    process = BULK_OPERATIONS[operation]
+    results, failures = [], []
+
+    for index, document in enumerate(documents, start):
+        raw = not isinstance(document, dict)
+        try:
+            if raw:
+                document = json.loads(document)
+            result = process(document, dummy_key, target_fields, **options)
+            if raw and result is not None:
+                result = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        except BULK_RECORD_ERRORS as e:
+            failures.append((index, e))
+            result = None
+        results.append(result)
+
+    return results, failures
+
+
+def bulk_lib(
+    documents,
+    operation: str,
+    dummy_key,
+    target_fields: list[str],
+    chunk_size: int = 1000,
+    workers: int = None,
+    report: BulkReport = None,
+    **options,
+):
+    """
+    Protects, unprotects or checks many documents on a pool of processes.
+
+    Documents are split into chunks of `chunk_size` and handed to `workers`
+    processes; at most two chunks per worker are in flight, so memory use does
+    not depend on the input size. Results are yielded in input order. Documents
+    may be dicts, or raw JSON strings / bytes, in which case parsing and
+    serialization happen in the workers and JSON strings are yielded.
+
+    Args:
+        documents (Iterable[dict | str | bytes]): documents to process
+        operation (str): one of "protect", "unprotect" or "check"
+        dummy_key (str | bytes | KeyHandle): key file, raw key or keyring handle
+        target_fields (list[str]): fields to be encrypted / decrypted
+        chunk_size (int): number of documents per task
+        workers (int): number of processes, defaults to the number of CPUs
+        report (BulkReport): collects the record count and per-record failures
+        **options: extra keyword arguments for the operation, e.g. `envelope`
+            for "protect"
+
+    Yields:
+        dict | str | None: the result for each document, or None for failed
+            documents and for the "check" operation
+    """
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f"Unknown bulk operation: {operation}")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+
+    # Handles hold AEAD objects, which cannot be sent to other processes; each
+    # worker loads the key into its own keyring instead.
+    if isinstance(dummy_key, KeyHandle):
+        dummy_key = dummy_key.source
+    report = report if report is not None else BulkReport()
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        chunk = []
+        start = 0
+
+        def drain(limit):
+            while len(pending) > limit:
+                results, failures = pending.popleft().result()
+                for index, error in failures:
+                    report.add_failure(index, error)
+                report.records += len(results)
+                yield from results
+
+        for document in documents:
+            chunk.append(document)
+            if len(chunk) == chunk_size:
+                pending.append(
+                    pool.submit(
+                        _bulk_chunk,
+                        operation,
+                        dummy_key,
+                        target_fields,
+                        options,
+                        start,
+                        chunk,
+                    )
+                )
+                start += len(chunk)
+                chunk = []
+                yield from drain(2 * workers)
+
+        if chunk:
+            pending.append(
+                pool.submit(
+                    _bulk_chunk,
+                    operation,
+                    dummy_key,
+                    target_fields,
+                    options,
+                    start,
+                    chunk,
+                )
+            )
+        yield from drain(0)
+
+
+def _iter_json_lines(input_file: str, stats: StreamStats):
+    with click.open_file(input_file, "rb") as source:
+        for line in source:
+            stats.bytes_in += len(line)
+            if line.strip():
+                yield line
+
+
+def _bulk_command(
+    operation: str,
+    input_file: str,
+    dummy_key: str,
+    output_file: str,
+    target_fields: list[str],
+    chunk_size: int,
+    workers: int,
+    failures_file: str,
+    **options,
+) -> bool:
+    stats = StreamStats()
+    report = BulkReport()
+    results = bulk_lib(
+        _iter_json_lines(input_file, stats),
+        operation,
+        dummy_key,
+        target_fields,
+        chunk_size,
+        workers,
+        report,
+        **options,
+    )
+
+    if output_file is None:
+        collections.deque(results, maxlen=0)
+    else:
+        with click.open_file(output_file, "w", encoding="utf-8") as sink:
+            for result in results:
+                if result is not None:
+                    sink.write(result)
+                    sink.write("\n")
+
+    stats.records = report.records
+    click.echo(stats.report(), err=True)
+
+    if failures_file:
+        with click.open_file(failures_file, "w", encoding="utf-8") as sink:
+            for index, error in report.failures:
+                sink.write(json.dumps({"record": index, "error": error}) + "\n")
+    if report.failures:
+        click.echo(f"{len(report.failures)} records failed", err=True)
+        for index, error in report.failures[:10]:
+            click.echo(f"  record {index}: {error}", err=True)
+        # Let audit scripts tell a clean run from one with bad records.
+        click.get_current_context().exit(1)
+    return True
+
+
+def bulk_options(command):
+    command = click.option(
+        "--failures",
+        "failures_file",
+        default=None,
+        help="Write per-record failures to this JSONL file.",
+    )(command)
+    command = click.option(
+        "--workers", "-w", default=None, type=int, help="Defaults to the CPU count."
+    )(command)
+    command = click.option("--chunk-size", "-c", default=1000, show_default=True)(
+        command
+    )
+    return click.option("--target_fields", "-t", multiple=True, required=True)(command)
+
+
+@cli.command()
+@click.argument("input_file")
+@click.argument("dummy_key")
+@click.argument("output_file")
+@bulk_options
+@click.option(
+    "--envelope",
+    type=click.Choice(["json", "compact", "document", "split"]),
+    default="json",
+    show_default=True,
+    help="Format of the protected fields.",
+)
+@compression_options
+def bulk_protect(
+    input_file,
+    dummy_key,
+    output_file,
+    target_fields,
+    chunk_size,
+    workers,
+    failures_file,
+    envelope,
+    compression,
+    compression_level,
+) -> bool:
+    """
+    Encrypts the target fields of every document in a JSONL file using a pool
+    of processes, writing the protected documents in input order.
+    """
+    return _bulk_command(
+        "protect",
+        input_file,
+        dummy_key,
+        output_file,
+        target_fields,
+        chunk_size,
+        workers,
+        failures_file,
+        envelope=envelope,
+        compression=compression,
+        compression_level=compression_level,
+    )
+
+
+@cli.command()
+@click.argument("input_file")
+@click.argument("dummy_key")
+@click.argument("output_file")
+@bulk_options
+def bulk_unprotect(
+    input_file,
+    dummy_key,
+    output_file,
+    target_fields,
+    chunk_size,
+    workers,
+    failures_file,
+) -> bool:
+    """
+    Decrypts the target fields of every document in a JSONL file using a pool
+    of processes, writing the decrypted documents in input order.
+    """
+    return _bulk_command(
+        "unprotect",
+        input_file,
+        dummy_key,
+        output_file,
+        target_fields,
+        chunk_size,
+        workers,
+        failures_file,
+    )
+
+
+@cli.command()
+@click.argument("input_file")
+@click.argument("dummy_key")
+@bulk_options
+def bulk_check(
+    input_file, dummy_key, target_fields, chunk_size, workers, failures_file
+) -> bool:
+    """
+    Checks the integrity of every document in a JSONL file using a pool of
+    processes.
+    """
+    return _bulk_command(
+        "check",
+        input_file,
+        dummy_key,
+        None,
+        target_fields,
+        chunk_size,
+        workers,
+        failures_file,
+    )
+
+
 @cli.command()
 @click.argument("output_file")
 def generate_key(output_file: str):
@@ -231,6 +1322,53 @@ def generate_key(output_file: str):
         f.write(key_encoded)
 
 
+@cli.command()
+@click.argument("input_file")
+@click.argument("private_key")
+@click.argument("output_file")
+def sign_file(input_file: str, private_key: str, output_file: str) -> None:
+    """
+    Command that signs a (possibly very large) file in constant memory and
+    writes the base64 signature to the output file.
+
+    Args:
+        input_file (str): file to be signed ("-" for stdin)
+        private_key (str): PEM private key file
+        output_file (str): file to write the signature to ("-" for stdout)
+    """
+    signer = Signer.for_file(private_key)
+    source = sys.stdin.buffer if input_file == "-" else input_file
+    signature = signer.sign_file(source)
+    with click.open_file(output_file, "w", encoding="utf-8") as file:
+        file.write(signature + "\n")
+
+
+@cli.command()
+@click.argument("input_file")
+@click.argument("certificate")
+@click.argument("signature_file")
+def verify_file(input_file: str, certificate: str, signature_file: str) -> bool:
+    """
+    Command that verifies the signature of a (possibly very large) file in
+    constant memory, exiting with status 1 if it is not valid.
+
+    Args:
+        input_file (str): signed file ("-" for stdin)
+        certificate (str): PEM certificate of the signer
+        signature_file (str): file holding the base64 signature
+    """
+    with open(signature_file, "r", encoding="utf-8") as file:
+        signature = file.read().strip()
+
+    cert = PKI.load_certificate(certificate)
+    source = sys.stdin.buffer if input_file == "-" else input_file
+    if not PKI.verify_file(cert, source, signature):
+        print(f"Signature of {input_file} is NOT valid!")
+        click.get_current_context().exit(1)
+    print(f"Signature of {input_file} is valid.")
+    return True
+
+
 def load_private_key(file_path):
     """Loads an RSA private key from a file."""
     with open(file_path, "rb") as key_file:
@@ -249,29 +1387,328 @@ def load_public_key(file_path):
 
 def sha256_hash(data):
     """Calculates the SHA-256 hash of the given data."""
-    hash_object = hashlib.sha256(data.encode("utf-8"))
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    hash_object = hashlib.sha256(data)
     sha256 = hash_object.hexdigest()
     return sha256
 
 
+def sha256_file(source, chunk_size: int = 1 << 20) -> str:
+    """
+    Calculates the SHA-256 hash of a file or binary stream without loading it
+    into memory. Regular files are memory-mapped; other inputs (pipes, sockets,
+    file objects) are read in chunks of `chunk_size` bytes.
+
+    Args:
+        source (str | os.PathLike | BinaryIO): file path or binary stream
+
+    Returns:
+        str: the hex digest, as returned by `sha256_hash` for the same bytes
+    """
+    if not hasattr(source, "read"):
+        with open(source, "rb") as file:
+            return sha256_file(file, chunk_size)
+
+    hash_object = hashlib.sha256()
+    try:
+        # Mapping fails on empty files and on streams without a real file.
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        mapped = None
+
+    if mapped is not None:
+        step = max(mmap.PAGESIZE, chunk_size - chunk_size % mmap.PAGESIZE)
+        with mapped, memoryview(mapped) as view:
+            for start in range(0, len(view), step):
+                hash_object.update(view[start : start + step])
+                # Unmap hashed pages so resident memory stays flat; they stay
+                # in the page cache.
+                if hasattr(mmap, "MADV_DONTNEED"):
+                    mapped.madvise(
+                        mmap.MADV_DONTNEED, start, min(step, len(view) - start)
+                    )
+        return hash_object.hexdigest()
+
+    while chunk := source.read(chunk_size):
+        hash_object.update(chunk)
+    return hash_object.hexdigest()
+
+
+class _PrivateKeyHolder:
+    """
+    Base for objects that wrap a private key loaded once and then shared.
+
+    Private key objects are immutable, so a holder can be used from many
+    threads at once. `for_file` returns a per-process cached instance for a
+    key file, reloading it if the file changes.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, private_key):
+        self.private_key = private_key
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Returns a new instance for the key in `file_path`."""
+        return cls(load_private_key(file_path))
+
+    @classmethod
+    def for_file(cls, file_path):
+        """Returns the cached instance for the key in `file_path`."""
+        path = os.path.abspath(os.fspath(file_path))
+        stamp = Keyring._stamp(path)
+        with _PrivateKeyHolder._instances_lock:
+            cached = _PrivateKeyHolder._instances.get((cls, path))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        instance = cls.from_file(path)
+        with _PrivateKeyHolder._instances_lock:
+            _PrivateKeyHolder._instances[(cls, path)] = (stamp, instance)
+        return instance
+
+
+# Signatures are always computed over the hex SHA-256 digest of the data; the
+# algorithm follows the key type: RSA-PSS (SHA-256), ECDSA (SHA-256) or Ed25519.
+PSS_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
+)
+
+
+def signature_algorithm(key) -> str:
+    """Returns the signature algorithm used for a private or public key."""
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "rsa-pss"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return "ecdsa"
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "ed25519"
+    raise ValueError("Unsupported signature key type: ", type(key).__name__)
+
+
+def _sign_message(private_key, message: bytes) -> bytes:
+    algorithm = signature_algorithm(private_key)
+    if algorithm == "rsa-pss":
+        return private_key.sign(message, PSS_PADDING, hashes.SHA256())
+    if algorithm == "ecdsa":
+        return private_key.sign(message, ec.ECDSA(hashes.SHA256()))
+    return private_key.sign(message)
+
+
+def _verify_message(public_key, signature: bytes, message: bytes) -> None:
+    algorithm = signature_algorithm(public_key)
+    if algorithm == "rsa-pss":
+        public_key.verify(signature, message, PSS_PADDING, hashes.SHA256())
+    elif algorithm == "ecdsa":
+        public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+    else:
+        public_key.verify(signature, message)
+
+
+class Signer(_PrivateKeyHolder):
+    """Signs data with a preloaded RSA, EC (P-256) or Ed25519 private key."""
+
+    def sign(self, data) -> str:
+        """Signs the given data (SHA-256 hash), returning a base64 signature."""
+        return self.sign_digest(sha256_hash(data))
+
+    def sign_file(self, source) -> str:
+        """Signs a file or binary stream of any size in constant memory."""
+        return self.sign_digest(sha256_file(source))
+
+    def sign_digest(self, data_hash: str) -> str:
+        """Signs an already computed hex SHA-256 digest."""
+        # Sign the hash
+        signature = _sign_message(self.private_key, data_hash.encode("utf-8"))
+        signature = base64.b64encode(signature)
+
+        return signature.decode("utf-8")
+
+
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None,
+)
+
+# Hybrid public-key encryption, for payloads of any size and for EC keys:
+#   version (1 byte) | kem id (1 byte) | encapsulated key length (2 bytes) |
+#   encapsulated key | nonce (12 bytes) | ChaCha20-Poly1305 ciphertext
+# Everything before the nonce is authenticated as associated data. With RSA the
+# encapsulated key is a fresh payload key wrapped with RSA-OAEP; with EC and
+# X25519 it is an ephemeral public key, and the payload key is derived from the
+# ECDH shared secret with HKDF-SHA256.
+HYBRID_VERSION = 1
+HYBRID_KEM_RSA_OAEP = 1
+HYBRID_KEM_ECDH = 2
+HYBRID_KEM_X25519 = 3
+ENCRYPTION_MODES = ("auto", "rsa", "hybrid")
+
+
+def _hybrid_payload_key(shared_secret: bytes, encapsulated_key: bytes) -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"motorist-hybrid-v1" + encapsulated_key,
+    ).derive(shared_secret)
+
+
+def hybrid_seal(public_key, plaintext: bytes) -> bytes:
+    """
+    Encrypts `plaintext` for the owner of `public_key` (RSA, EC or X25519) with
+    the hybrid scheme described above.
+    """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        kem = HYBRID_KEM_RSA_OAEP
+        payload_key = EncryptionAlgo.generate_key()
+        encapsulated_key = public_key.encrypt(payload_key, OAEP_PADDING)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        kem = HYBRID_KEM_ECDH
+        ephemeral = ec.generate_private_key(public_key.curve)
+        encapsulated_key = ephemeral.public_key().public_bytes(
+            Encoding.X962, PublicFormat.UncompressedPoint
+        )
+        payload_key = _hybrid_payload_key(
+            ephemeral.exchange(ec.ECDH(), public_key), encapsulated_key
+        )
+    elif isinstance(public_key, x25519.X25519PublicKey):
+        kem = HYBRID_KEM_X25519
+        ephemeral = x25519.X25519PrivateKey.generate()
+        encapsulated_key = ephemeral.public_key().public_bytes_raw()
+        payload_key = _hybrid_payload_key(
+            ephemeral.exchange(public_key), encapsulated_key
+        )
+    else:
+        raise ValueError("Unsupported public key type: ", type(public_key).__name__)
+
+    header = (
+        struct.pack(">BBH", HYBRID_VERSION, kem, len(encapsulated_key))
+        + encapsulated_key
+    )
+    nonce = secrets.token_bytes(12)
+    return (
+        header + nonce + EncryptionAlgo(payload_key).encrypt(nonce, plaintext, header)
+    )
+
+
+class Decryptor(_PrivateKeyHolder):
+    """Decrypts data encrypted by `PKI.encrypt_data` with a preloaded private key."""
+
+    def decrypt(self, encrypted_data) -> str:
+        return self.decrypt_bytes(encrypted_data).decode("utf-8")
+
+    def decrypt_bytes(self, encrypted_data) -> bytes:
+        """Decrypts base64 data sealed with plain RSA-OAEP or the hybrid scheme."""
+        encrypted_data = base64.b64decode(encrypted_data)
+        if (
+            isinstance(self.private_key, rsa.RSAPrivateKey)
+            and len(encrypted_data) == self.private_key.key_size // 8
+        ):
+            # Plain RSA-OAEP; hybrid messages are always longer than the modulus.
+            return self.private_key.decrypt(encrypted_data, OAEP_PADDING)
+        return self._hybrid_open(encrypted_data)
+
+    def _hybrid_open(self, data: bytes) -> bytes:
+        if len(data) < 4:
+            raise ValueError("Invalid hybrid ciphertext")
+        version, kem, key_length = struct.unpack_from(">BBH", data)
+        if version != HYBRID_VERSION:
+            raise ValueError("Unsupported hybrid ciphertext version: ", version)
+
+        header_length = 4 + key_length
+        header = data[:header_length]
+        encapsulated_key = data[4:header_length]
+        nonce = data[header_length : header_length + 12]
+        ciphertext = data[header_length + 12 :]
+
+        private_key = self.private_key
+        if kem == HYBRID_KEM_RSA_OAEP and isinstance(private_key, rsa.RSAPrivateKey):
+            payload_key = private_key.decrypt(encapsulated_key, OAEP_PADDING)
+        elif kem == HYBRID_KEM_ECDH and isinstance(
+            private_key, ec.EllipticCurvePrivateKey
+        ):
+            peer = ec.EllipticCurvePublicKey.from_encoded_point(
+                private_key.curve, encapsulated_key
+            )
+            payload_key = _hybrid_payload_key(
+                private_key.exchange(ec.ECDH(), peer), encapsulated_key
+            )
+        elif kem == HYBRID_KEM_X25519 and isinstance(
+            private_key, x25519.X25519PrivateKey
+        ):
+            peer = x25519.X25519PublicKey.from_public_bytes(encapsulated_key)
+            payload_key = _hybrid_payload_key(
+                private_key.exchange(peer), encapsulated_key
+            )
+        else:
+            raise ValueError("Hybrid ciphertext does not match the private key type")
+
+        return EncryptionAlgo(payload_key).decrypt(nonce, ciphertext, header)
+
+
 def sign_data(file_path, data):
     """Signs the given data (SHA-256 hash) using the private key."""
-    # Calculate hash
-    private_key = load_private_key(file_path)
-    # data to bytes
-    data_hash = sha256_hash(data)
-
-    # Sign the hash
-    signature = private_key.sign(
-        data_hash.encode("utf-8"),
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256(),
-    )
-    signature = base64.b64encode(signature)
+    return Signer.for_file(file_path).sign(data)
+
+
+class VerificationCache:
+    """
+    Bounded LRU cache of verification results.
+
+    Each entry holds a result and the time it expires at, which callers derive
+    from the validity of the certificate involved. For signatures, entries are
+    keyed by (certificate fingerprint, SHA-256 of the data, signature) and only
+    successful verifications are cached, so a failure is always re-checked.
+    """
 
-    return signature.decode("utf-8")
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key, now: datetime):
+        """Returns the unexpired result cached for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def store(self, key, result, expires: datetime) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
 
 
 class PKI:
@@ -282,9 +1719,38 @@ class PKI:
       - https://cryptography.io/en/43.0.1/x509/reference/#general-name-classes
     """
 
-    def __init__(self, root_cacert_path):
+    # Shared by every caller of verify_signature; see VerificationCache.
+    verification_cache = VerificationCache()
+
+    # Thread pool used by verify_many, created on first use. Batches smaller
+    # than `verify_parallel_threshold` are not worth the hand-off.
+    verify_workers = os.cpu_count() or 1
+    verify_parallel_threshold = 32
+    _verify_pool = None
+    _verify_pool_lock = threading.Lock()
+
+    def __init__(
+        self,
+        root_cacert_path,
+        client_cert_ttl: float = 300.0,
+        verifier_granularity: float = 60.0,
+    ):
+        """
+        Args:
+            root_cacert_path (str): path of the root CA certificate
+            client_cert_ttl (float): seconds a successful client certificate
+                verification is reused for, capped at the certificate's expiry
+            verifier_granularity (float): seconds a client verifier is reused
+                for; chain validity is evaluated at the time it was built
+        """
         self.root_ca = PKI.load_certificate(root_cacert_path)
         self.store = Store([self.root_ca])
+        self.client_cert_ttl = timedelta(seconds=client_cert_ttl)
+        self.verifier_granularity = timedelta(seconds=verifier_granularity)
+        self.client_cert_cache = VerificationCache()
+        self._client_verifier = None
+        self._client_verifier_time = None
+        self._client_verifier_lock = threading.Lock()
 
     # Not yet sure if needed.
     # def verify_server_cert(self, cert: Certificate, dns_name: str):
@@ -294,18 +1760,57 @@ class PKI:
     #     return verifier.verify(cert, [])
 
     # Verifies if a client certificate is valid.
+    # Successes are cached by the certificate's DER fingerprint until the
+    # certificate expires or `client_cert_ttl` passes, whichever comes first.
+    # Failures are not cached, so a certificate that becomes valid is accepted.
     def verify_client_cert(self, cert: Certificate) -> tuple[bool, str]:
-        builder = PolicyBuilder().store(self.store)
-        builder = builder.time(datetime.now())
-        verifier = builder.build_client_verifier()
-        try:
-            verified_client = verifier.verify(cert, [])
-            # Assume a client certificate only contains one subject a.k.a email identifier.
-            return (True, verified_client.subjects[0].value)
+        now = datetime.now(timezone.utc)
+        cache_key = cert.fingerprint(hashes.SHA256())
+        cached = self.client_cert_cache.lookup(cache_key, now)
+        if cached is not None:
+            return cached
+
+        verified_client = self._verify_client(self._get_client_verifier(now), cert)
+        if verified_client is None:
+            # The shared verifier validates at the time it was built, when the
+            # certificate may not have been valid yet. Check again at `now`.
+            verified_client = self._verify_client(
+                self._build_client_verifier(now), cert
+            )
+        if verified_client is None or not (
+            # The shared verifier may predate the certificate's expiry.
+            cert.not_valid_before_utc <= now < cert.not_valid_after_utc
+        ):
+            return (False, None)
+
+        # Assume a client certificate only contains one subject a.k.a email identifier.
+        result = (True, verified_client.subjects[0].value)
+        expires = min(now + self.client_cert_ttl, cert.not_valid_after_utc)
+        self.client_cert_cache.store(cache_key, result, expires)
+        return result
 
+    @staticmethod
+    def _verify_client(verifier, cert: Certificate):
+        """Returns the verified client, or None if `cert` is not valid."""
+        try:
+            return verifier.verify(cert, [])
         except VerificationError:
-            # Client's certificate is not valid.
-            return (False, None)
+            return None
+
+    def _build_client_verifier(self, now: datetime):
+        return PolicyBuilder().store(self.store).time(now).build_client_verifier()
+
+    def _get_client_verifier(self, now: datetime):
+        # Building a verifier is not free, and its validation time is fixed at
+        # build time, so one is shared until the clock moves past the granularity.
+        with self._client_verifier_lock:
+            if (
+                self._client_verifier is None
+                or now - self._client_verifier_time >= self.verifier_granularity
+            ):
+                self._client_verifier = self._build_client_verifier(now)
+                self._client_verifier_time = now
+            return self._client_verifier
 
     @staticmethod
     def __get_subject_names(cert: Certificate):
@@ -339,26 +1844,102 @@ class PKI:
 
     @staticmethod
     def verify_signature(cert: Certificate, data, signature) -> bool:
-        """Verifies the signature of the given data using a certificate's public key."""
-        data_hash = sha256_hash(data)
+        """
+        Verifies the signature of the given data using a certificate's public key.
+
+        Successful verifications are remembered in `PKI.verification_cache`
+        while the certificate is valid, so re-checking the same row is cheap.
+        """
+        return PKI.verify_digest(cert, sha256_hash(data), signature)
+
+    @staticmethod
+    def verify_file(cert: Certificate, source, signature) -> bool:
+        """
+        Verifies the signature of a file or binary stream of any size, hashing
+        it in constant memory (see `sha256_file`).
+        """
+        return PKI.verify_digest(cert, sha256_file(source), signature)
+
+    @staticmethod
+    def verify_digest(cert: Certificate, data_hash: str, signature) -> bool:
+        """Verifies a signature over an already computed hex SHA-256 digest."""
+        cache_key = (cert.fingerprint(hashes.SHA256()), data_hash, signature)
+        now = datetime.now(timezone.utc)
+        if PKI.verification_cache.lookup(cache_key, now):
+            return True
+
         signature = base64.b64decode(signature)
         public_key = cert.public_key()
 
         try:
-            public_key.verify(
-                signature,
-                data_hash.encode("utf-8"),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH,
-                ),
-                hashes.SHA256(),
-            )
+            # The algorithm follows the certificate's key type, see Signer.
+            _verify_message(public_key, signature, data_hash.encode("utf-8"))
+            if cert.not_valid_before_utc <= now < cert.not_valid_after_utc:
+                PKI.verification_cache.store(cache_key, True, cert.not_valid_after_utc)
             return True
         except Exception as e:
             print("Signature verification failed with exception: ", e)
             return False
 
+    @staticmethod
+    def verify_many(items, workers: int = None) -> list[bool]:
+        """
+        Verifies many signatures on a thread pool; OpenSSL releases the GIL
+        while verifying, so the work spreads across cores.
+
+        Args:
+            items (Iterable[tuple[Certificate, str, str]]): (certificate, data,
+                signature) triples, as taken by `verify_signature`
+            workers (int): most threads used at once, defaults to (and is capped
+                by) `PKI.verify_workers`, the size of the shared thread pool
+
+        Returns:
+            list[bool]: the verification result of each item, in input order
+        """
+        items = list(items)
+        workers = min(workers or PKI.verify_workers, len(items))
+        if workers <= 1 or len(items) < PKI.verify_parallel_threshold:
+            return [PKI.verify_signature(*item) for item in items]
+
+        # A few chunks per thread keeps the per-task overhead low while still
+        # balancing the load when some signatures are cache hits.
+        chunk_size = -(-len(items) // (workers * 4))
+        chunks = [
+            items[start : start + chunk_size]
+            for start in range(0, len(items), chunk_size)
+        ]
+        pool = PKI._get_verify_pool()
+        # The pool is shared, so cap this call's chunks in flight at `workers`.
+        slots = threading.Semaphore(workers)
+
+        def verify_chunk(chunk):
+            try:
+                return PKI._verify_chunk(chunk)
+            finally:
+                slots.release()
+
+        futures = []
+        for chunk in chunks:
+            slots.acquire()
+            futures.append(pool.submit(verify_chunk, chunk))
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    @staticmethod
+    def _verify_chunk(chunk) -> list[bool]:
+        return [PKI.verify_signature(*item) for item in chunk]
+
+    @staticmethod
+    def _get_verify_pool() -> ThreadPoolExecutor:
+        with PKI._verify_pool_lock:
+            if PKI._verify_pool is None:
+                PKI._verify_pool = ThreadPoolExecutor(
+                    max_workers=PKI.verify_workers, thread_name_prefix="verify"
+                )
+            return PKI._verify_pool
+
     @staticmethod
     def load_certificate(cert_path=None, cert_binary=None):
         if cert_path:
@@ -371,34 +1952,49 @@ class PKI:
         raise ValueError("must specify either cert_path or cert_binary")
 
     @staticmethod
-    def encrypt_data(data, cert_path):
-        """Encrypts data using a certificate's public key."""
-        cert = PKI.load_certificate(cert_path)
-        public_key = cert.public_key()
-        encrypted_data = public_key.encrypt(
-            data.encode("utf-8"),
-            padding.OAEP(
-                mgf=padding.MGF1(hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None,
-            ),
+    def encrypt_data(data, cert_path, mode: str = "auto"):
+        """
+        Encrypts data using a certificate's public key.
+
+        Args:
+            data (str | bytes): data to be encrypted
+            cert_path (str | Certificate): certificate file, or a loaded certificate
+            mode (str): "rsa" for plain RSA-OAEP (RSA keys, up to ~190 bytes),
+                "hybrid" for the hybrid scheme (any size, RSA / EC / X25519
+                keys), or "auto" to use plain RSA-OAEP whenever it fits
+
+        Returns:
+            str: the base64 encoded ciphertext, readable by `decrypt_data`
+        """
+        if mode not in ENCRYPTION_MODES:
+            raise ValueError("Unknown encryption mode: ", mode)
+        cert = (
+            cert_path
+            if isinstance(cert_path, Certificate)
+            else PKI.load_certificate(cert_path)
         )
+        public_key = cert.public_key()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        if mode == "auto":
+            # OAEP-SHA256 fits at most k - 2 * 32 - 2 bytes.
+            fits = (
+                isinstance(public_key, rsa.RSAPublicKey)
+                and len(data) <= public_key.key_size // 8 - 66
+            )
+            mode = "rsa" if fits else "hybrid"
+
+        if mode == "rsa":
+            encrypted_data = public_key.encrypt(data, OAEP_PADDING)
+        else:
+            encrypted_data = hybrid_seal(public_key, data)
         return base64.b64encode(encrypted_data).decode("utf-8")
 
     @staticmethod
     def decrypt_data(encrypted_data, private_key_path):
         """Decrypts data using a private key."""
-        encrypted_data = base64.b64decode(encrypted_data)
-        private_key = load_private_key(private_key_path)
-        decrypted_data = private_key.decrypt(
-            encrypted_data,
-            padding.OAEP(
-                mgf=padding.MGF1(hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None,
-            ),
-        )
-        return decrypted_data.decode("utf-8")
+        return Decryptor.for_file(private_key_path).decrypt(encrypted_data)
 
 
 if __name__ == "__main__":
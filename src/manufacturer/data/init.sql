@@ -1,4 +1,6 @@
-DROP TABLE IF EXISTS firmware_requests;
+-- Latest schema, for new databases. Existing databases are upgraded in place
+-- by the migrations in migrations/, which the manufacturer applies when it
+-- starts. A schema change goes into a new migration, and here.
 
 -- SQL Dump for 'updates' table
 CREATE TABLE IF NOT EXISTS firmware_requests (
@@ -9,4 +11,19 @@ CREATE TABLE IF NOT EXISTS firmware_requests (
     timestamp TIMESTAMP NOT NULL    -- Timestamp of the update
 );
 
+CREATE INDEX IF NOT EXISTS firmware_requests_car_id_idx
+    ON firmware_requests (car_id, id DESC);
+
+-- Migrations this schema already includes
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+INSERT INTO schema_migrations (version, name) VALUES
+    (1, 'initial_schema'),
+    (2, 'history_indexes')
+ON CONFLICT DO NOTHING;
+
 ALTER TABLE firmware_requests OWNER TO "manufacturer-web";
+ALTER TABLE schema_migrations OWNER TO "manufacturer-web";
@@ -0,0 +1,3 @@
+-- The history of a car is read in id order, without scanning the whole table.
+CREATE INDEX IF NOT EXISTS firmware_requests_car_id_idx
+    ON firmware_requests (car_id, id DESC);
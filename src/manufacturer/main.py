@@ -5,6 +5,7 @@ from datetime import datetime
 import cryptolib
 from psycopg_pool import ConnectionPool
 from common import Common
+from common.migrations import migrate
 
 
 # Database connection parameters
@@ -13,6 +14,15 @@ PG_CONNSTRING = os.getenv(
     "host=localhost port=7654 dbname=motorist-manufacturer-db user=postgres password=password",
 )
 MANUF_PRIV_KEY = f"{Common.KEY_STORE}/manufacturer-web/key.priv"
+# Schema migrations applied on start, see `common.migrations`.
+MIGRATIONS_DIR = f"{os.path.dirname(__file__)}/data/migrations"
+# The firmwares requested for a car, oldest first.
+FIRMWARE_HISTORY_QUERY = """
+    SELECT firmware, timestamp, signature
+    FROM firmware_requests
+    WHERE car_id = %(car_id)s
+    ORDER BY id;
+    """
 
 
 # Initialize the connection pool
@@ -27,6 +37,8 @@ class Manufacturer:
     def __init__(self, id):
         self.id = id
         self.key_store = f"{Common.KEY_STORE}/manufacturer-web"
+        # Parse the signing key once instead of on every firmware request.
+        self.signer = cryptolib.Signer.for_file(MANUF_PRIV_KEY)
 
 
 app = Flask(__name__)
@@ -44,7 +56,7 @@ def get_firmware(car_id):
     current_time = time.time()
     formatted_time = datetime.fromtimestamp(current_time).strftime("%Y-%m-%d %H:%M:%S")
     firmware = f"firmware-{car_id}-v{int(current_time)}"
-    signature = cryptolib.sign_data(MANUF_PRIV_KEY, firmware)
+    signature = manufacturer.signer.sign(firmware)
     data = {"firmware": firmware, "signature": signature}
 
     with pool.connection() as conn:
@@ -71,11 +83,7 @@ def get_history(car_id):
     with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT firmware, timestamp, signature
-                FROM firmware_requests
-                WHERE car_id = %(car_id)s;
-                """,
+                FIRMWARE_HISTORY_QUERY,
                 {
                     "car_id": car_id,
                 },
@@ -93,6 +101,8 @@ def get_history(car_id):
 
 def start():
     global manufacturer
+    for version in migrate(pool, MIGRATIONS_DIR):
+        print(f"Applied schema migration {version}")
     manufacturer = Manufacturer("1")
     # set different port for manufacturer
     port = Common.MANUFACTURER_PORT
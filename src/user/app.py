@@ -209,7 +209,7 @@ class HomeScreen(Screen):
                     self.display_output(response.text)
 
                 else:
-                    car_unprotected_doc = cryptolib.unprotect_lib(
+                    car_unprotected_doc = cryptolib.ProtectedDocument(
                         response.json(), f"{app.key_store}/car.key", ["configuration"]
                     )
                     self.display_output(
@@ -269,6 +269,8 @@ class UpdateConfigScreen(Screen):
     def on_mount(self) -> None:
         """Fetch the current configuration when the screen is mounted."""
         app = self.app  # Get reference to the main app instance
+        # Last configuration known to be on the car, updates are sent as deltas to it
+        self.current_config = None
         try:
             # Fetch current configuration from Flask API
             response = req.get(
@@ -283,13 +285,12 @@ class UpdateConfigScreen(Screen):
                     f"{Common.CAR_URL}/get-config",
                 )
             if response.status_code == 200:
-                car_unprotected_doc = cryptolib.unprotect_lib(
+                car_unprotected_doc = cryptolib.ProtectedDocument(
                     response.json(), f"{app.key_store}/car.key", ["configuration"]
                 )
                 # Assuming the config is returned as a dictionary
-                self.config_input.value = json.dumps(
-                    car_unprotected_doc["configuration"]
-                )
+                self.current_config = car_unprotected_doc["configuration"]
+                self.config_input.value = json.dumps(self.current_config)
 
             else:
                 self.display_output("Failed to fetch current configuration.")
@@ -307,18 +308,36 @@ class UpdateConfigScreen(Screen):
                 new_config_str = self.query_one("#update-config", Input).value
                 new_config = json.loads(new_config_str) if new_config_str else None
 
-                if new_config:
-                    car_doc_unprotected = {
-                        "carID": app.car_id,
-                        "user": app.owner_id,
-                        "configuration": new_config,
-                    }
-                    # TODO: change these hardcoded values
-                    car_doc_protected = cryptolib.protect_lib(
-                        car_doc_unprotected,
-                        f"{app.key_store}/car.key",
-                        ["configuration"],
-                    )
+                if new_config and new_config == self.current_config:
+                    self.display_output("Configuration unchanged.")
+                elif new_config:
+                    if isinstance(self.current_config, dict) and isinstance(
+                        new_config, dict
+                    ):
+                        # Only send the changed sub-fields
+                        car_doc_protected = {
+                            "carID": app.car_id,
+                            "user": app.owner_id,
+                            "configuration": cryptolib.protect_delta(
+                                self.current_config,
+                                new_config,
+                                f"{app.key_store}/car.key",
+                            ),
+                            "delta": True,
+                        }
+                    else:
+                        car_doc_unprotected = {
+                            "carID": app.car_id,
+                            "user": app.owner_id,
+                            "configuration": new_config,
+                        }
+                        # TODO: change these hardcoded values
+                        car_doc_protected = cryptolib.protect_lib(
+                            car_doc_unprotected,
+                            f"{app.key_store}/car.key",
+                            ["configuration"],
+                            envelope="compact",
+                        )
 
                     response = req.post(
                         f"{Common.CAR_URL}/update-config",
@@ -333,6 +352,12 @@ class UpdateConfigScreen(Screen):
                             f"{Common.CAR_URL}/update-config",
                             json=car_doc_protected,
                         )
+                    if response.status_code == 200:
+                        self.current_config = new_config
+                    elif response.status_code >= 500:
+                        # Whether the car stored it is unknown: send the
+                        # next update in full rather than as a delta.
+                        self.current_config = None
                     self.display_output(response.text)
                 else:
                     self.display_output("Please enter a valid configuration JSON.")
@@ -0,0 +1,944 @@
+import base64
+import functools
+import json
+import os
+import platform
+import random
+import secrets
+import string
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import click
+import cryptography
+import requests
+from datetime import datetime, timedelta, timezone
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.x509.oid import NameOID
+
+import cryptolib
+
+with open(os.path.join(os.path.dirname(__file__), "default_config.json")) as f:
+    SAMPLE_DOC = json.load(f)
+
+
+def timeit(fn, iterations):
+    """Runs `fn` `iterations` times and returns the mean cost in microseconds."""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def write_throwaway_key(directory):
+    key_path = os.path.join(directory, "bench.key")
+    with open(key_path, "wb") as f:
+        f.write(base64.b64encode(ChaCha20Poly1305.generate_key()))
+    return key_path
+
+
+KEY_TYPES = {
+    "rsa": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ec": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "ed25519": lambda: ed25519.Ed25519PrivateKey.generate(),
+}
+
+
+def write_throwaway_identity(directory, name="bench", key_type="rsa"):
+    """
+    Writes a throwaway private key of `key_type` and a self-signed certificate
+    for it.
+
+    Returns:
+        tuple[str, str, x509.Certificate]: key path, certificate path and the
+            loaded certificate
+    """
+    private_key = KEY_TYPES[key_type]()
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .sign(private_key, None if key_type == "ed25519" else hashes.SHA256())
+    )
+
+    key_path = os.path.join(directory, f"{name}.priv")
+    cert_path = os.path.join(directory, f"{name}.crt")
+    with open(key_path, "wb") as f:
+        f.write(
+            private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return key_path, cert_path, cert
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=20000, show_default=True)
+@click.option("--fields", "-f", default=1, show_default=True)
+def keyring(iterations: int, fields: int) -> None:
+    """Per-document protect/unprotect cost without and with the keyring."""
+
+    def legacy_protect(doc, key_path, target_fields):
+        # protect_lib as it was before the keyring: key file read and AEAD
+        # object built on every call / field.
+        with open(key_path, "r", encoding="utf-8") as key_file:
+            key_bytes = base64.b64decode(key_file.read().strip())
+        nonce = secrets.token_bytes(12)
+        for field in target_fields:
+            value = json.dumps(doc[field], ensure_ascii=False).encode("utf-8")
+            doc[field] = {
+                "nonce": base64.b64encode(nonce).decode("utf-8"),
+                "ciphertext": base64.b64encode(
+                    ChaCha20Poly1305(key_bytes).encrypt(nonce, value, None)
+                ).decode("utf-8"),
+            }
+        return doc
+
+    def legacy_unprotect(doc, key_path, target_fields):
+        with open(key_path, "r", encoding="utf-8") as key_file:
+            key_bytes = base64.b64decode(key_file.read().strip())
+        out = doc.copy()
+        for field in target_fields:
+            out[field] = json.loads(
+                ChaCha20Poly1305(key_bytes).decrypt(
+                    base64.b64decode(doc[field]["nonce"]),
+                    base64.b64decode(doc[field]["ciphertext"]),
+                    None,
+                )
+            )
+        return out
+
+    target_fields = [f"configuration{i}" for i in range(fields)]
+    doc = {"carId": 1, "user": 1}
+    for field in target_fields:
+        doc[field] = SAMPLE_DOC["configuration"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_throwaway_key(tmp)
+        protected = cryptolib.protect_lib(dict(doc), key_path, target_fields)
+        handle = cryptolib.KEYRING.load(key_path)
+
+        results = {
+            "protect (legacy)": timeit(
+                lambda: legacy_protect(dict(doc), key_path, target_fields), iterations
+            ),
+            "protect (keyring)": timeit(
+                lambda: cryptolib.protect_lib(dict(doc), key_path, target_fields),
+                iterations,
+            ),
+            "protect (handle)": timeit(
+                lambda: cryptolib.protect_lib(dict(doc), handle, target_fields),
+                iterations,
+            ),
+            "unprotect (legacy)": timeit(
+                lambda: legacy_unprotect(protected, key_path, target_fields),
+                iterations,
+            ),
+            "unprotect (keyring)": timeit(
+                lambda: cryptolib.unprotect_lib(protected, key_path, target_fields),
+                iterations,
+            ),
+            "unprotect (handle)": timeit(
+                lambda: cryptolib.unprotect_lib(protected, handle, target_fields),
+                iterations,
+            ),
+        }
+
+    print(f"{fields} protected field(s), {iterations} iterations")
+    for name, cost in results.items():
+        print(f"  {name:<22} {cost:8.2f} us/doc")
+
+
+@cli.command()
+@click.option("--records", "-n", default=100000, show_default=True)
+@click.option("--chunk-size", "-c", default=1000, show_default=True)
+@click.option("--max-workers", "-w", default=os.cpu_count(), show_default=True)
+def bulk(records: int, chunk_size: int, max_workers: int) -> None:
+    """Bulk protect throughput as the number of worker processes grows."""
+    line = json.dumps({"carId": 1, "user": 1, **SAMPLE_DOC})
+    lines = [line] * records
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_throwaway_key(tmp)
+        baseline = None
+        workers = 1
+        while workers <= max_workers:
+            start = time.perf_counter()
+            for _ in cryptolib.bulk_lib(
+                lines, "protect", key_path, ["configuration"], chunk_size, workers
+            ):
+                pass
+            rate = records / (time.perf_counter() - start)
+            baseline = baseline or rate
+            print(
+                f"  {workers:>3} worker(s) {rate:10.0f} records/s "
+                f"(x{rate / baseline:.2f})"
+            )
+            workers *= 2
+
+
+@cli.command()
+@click.option("--rows", "-r", default=200, show_default=True)
+@click.option("--rounds", "-n", default=20, show_default=True)
+def verify_cache(rows: int, rounds: int) -> None:
+    """Re-verifying the same history rows with and without the cache."""
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path, _, cert = write_throwaway_identity(tmp)
+        history = [f"firmware-1-v{i}" for i in range(rows)]
+        history = [(row, cryptolib.sign_data(key_path, row)) for row in history]
+
+    def verify_history():
+        for row, signature in history:
+            assert cryptolib.PKI.verify_signature(cert, row, signature)
+
+    cache = cryptolib.PKI.verification_cache
+    maxsize = cache.maxsize
+
+    cache.maxsize = 0
+    cache.clear()
+    uncached = timeit(verify_history, rounds) / rows
+
+    cache.maxsize = maxsize
+    cache.clear()
+    cached = timeit(verify_history, rounds) / rows
+
+    print(f"{rows} rows re-verified {rounds + 1} times")
+    print(f"  uncached {uncached:8.2f} us/verify")
+    print(f"  cached   {cached:8.2f} us/verify")
+    print(f"  {cache.stats()}")
+
+
+@cli.command()
+@click.option(
+    "--rows",
+    "-r",
+    multiple=True,
+    type=int,
+    default=[10, 1000, 100000],
+    show_default=True,
+)
+@click.option("--workers", "-w", default=os.cpu_count(), show_default=True)
+@click.option("--distinct", default=1000, show_default=True)
+def verify_history(rows: list[int], workers: int, distinct: int) -> None:
+    """Sequential verification of a history versus PKI.verify_many."""
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path, _, cert = write_throwaway_identity(tmp)
+        # Signing is slow, so large histories cycle over `distinct` signed rows;
+        # the verification cache is disabled so every row is really verified.
+        signed = [f"firmware-1-v{i}" for i in range(min(distinct, max(rows)))]
+        signed = [(cert, row, cryptolib.sign_data(key_path, row)) for row in signed]
+
+    cache = cryptolib.PKI.verification_cache
+    maxsize, cache.maxsize = cache.maxsize, 0
+    cache.clear()
+    try:
+        for n in rows:
+            history = [signed[i % len(signed)] for i in range(n)]
+
+            start = time.perf_counter()
+            sequential = [cryptolib.PKI.verify_signature(*item) for item in history]
+            sequential_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parallel = cryptolib.PKI.verify_many(history, workers)
+            parallel_time = time.perf_counter() - start
+
+            assert sequential == parallel and all(parallel)
+            print(
+                f"  {n:>7} rows  sequential {sequential_time * 1e3:10.1f} ms  "
+                f"verify_many({workers}) {parallel_time * 1e3:10.1f} ms"
+            )
+    finally:
+        cache.maxsize = maxsize
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=500, show_default=True)
+def sign(iterations: int) -> None:
+    """Firmware signatures/s when re-reading the key versus a preloaded Signer."""
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path, _, _ = write_throwaway_identity(tmp)
+        firmware = "firmware-1-v1700000000"
+
+        def legacy_sign():
+            # sign_data before the Signer cache: PEM parsed on every call.
+            cryptolib.Signer(cryptolib.load_private_key(key_path)).sign(firmware)
+
+        signer = cryptolib.Signer.for_file(key_path)
+        results = {
+            "sign_data (legacy)": timeit(legacy_sign, iterations),
+            "sign_data (cached)": timeit(
+                lambda: cryptolib.sign_data(key_path, firmware), iterations
+            ),
+            "Signer.sign": timeit(lambda: signer.sign(firmware), iterations),
+        }
+
+    for name, cost in results.items():
+        print(f"  {name:<20} {1e6 / cost:8.0f} signatures/s ({cost:8.1f} us)")
+
+
+@cli.command()
+def envelope() -> None:
+    """Size of a protected configuration in each envelope format."""
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_throwaway_key(tmp)
+        sizes = {}
+        for name in cryptolib.ENVELOPES:
+            doc = cryptolib.protect_lib(
+                {"carId": 1, "user": 1, **SAMPLE_DOC}, key_path, ["configuration"], name
+            )
+            field = doc.get(cryptolib.DOCUMENT_FIELD, doc.get("configuration"))
+            # Size of the value as stored in `configurations.config`.
+            sizes[name] = len(field) if name == "raw" else len(json.dumps(field))
+            back = cryptolib.decrypt(doc, key_path, ["configuration"])
+            assert back["configuration"] == SAMPLE_DOC["configuration"]
+
+    plain = len(json.dumps(SAMPLE_DOC["configuration"]))
+    print(f"  plaintext {plain:6d} bytes")
+    for name, size in sizes.items():
+        print(f"  {name:<9} {size:6d} bytes ({size / sizes['json']:.0%} of json)")
+
+
+@cli.command()
+@click.option("--fields", "-f", multiple=True, type=int, default=(1, 10, 100))
+@click.option("--field-size", "-s", default=64, show_default=True)
+@click.option("--iterations", "-n", default=2000, show_default=True)
+def document(fields: tuple[int], field_size: int, iterations: int) -> None:
+    """protect_lib + decrypt cost per document, per field vs whole document."""
+    with tempfile.TemporaryDirectory() as tmp:
+        key = cryptolib.KEYRING.load(write_throwaway_key(tmp))
+        for count in fields:
+            names = [f"field{i}" for i in range(count)]
+            doc = {"carId": 1, "user": 1}
+            doc.update((name, secrets.token_hex(field_size // 2)) for name in names)
+            print(f"{count} fields of {field_size} bytes")
+            for name in ("json", "compact", "document"):
+                protected = cryptolib.protect_lib(dict(doc), key, names, name)
+                assert cryptolib.decrypt(protected, key, names) == doc
+
+                protect_cost = timeit(
+                    lambda: cryptolib.protect_lib(dict(doc), key, names, name),
+                    iterations,
+                )
+                decrypt_cost = timeit(
+                    lambda: cryptolib.decrypt(protected, key, names), iterations
+                )
+                print(
+                    f"  {name:<9} protect {protect_cost:8.1f} us  "
+                    f"decrypt {decrypt_cost:8.1f} us  "
+                    f"{len(json.dumps(protected)):7d} bytes"
+                )
+
+
+def realistic_config(profiles, seed=0):
+    """
+    A configuration shaped like SAMPLE_DOC["configuration"] holding `profiles`
+    driver profiles with varied values.
+    """
+    rng = random.Random(seed)
+    return {
+        "profiles": {
+            f"driver-{i}": {
+                "ac": rng.random() < 0.5,
+                "driver_door": rng.choice(["open", "closed", "locked"]),
+                "seat_position": rng.randint(0, 40),
+                "tire_pressure": {
+                    str(tire): f"{rng.randint(28, 40)}psi" for tire in range(1, 5)
+                },
+            }
+            for i in range(profiles)
+        }
+    }
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=500, show_default=True)
+@click.option("--level", "-l", multiple=True, type=int, default=(1, 6, 9))
+def compression(iterations: int, level: tuple[int]) -> None:
+    """Stored size and protect/decrypt cost of compressed configurations."""
+    configs = {"sample": SAMPLE_DOC["configuration"]}
+    configs.update(
+        (f"{profiles} profiles", realistic_config(profiles)) for profiles in (4, 50)
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        key = cryptolib.KEYRING.load(write_throwaway_key(tmp))
+        for name, config in configs.items():
+            doc = {"carId": 1, "user": 1, "configuration": config}
+            print(f"{name} ({len(json.dumps(config))} bytes)")
+            for compression_level in (None, *level):
+                options = {"compression_threshold": 0}
+                if compression_level is not None:
+                    options.update(
+                        compression="zlib", compression_level=compression_level
+                    )
+                protected = cryptolib.protect_lib(
+                    dict(doc), key, ["configuration"], "compact", **options
+                )
+                assert cryptolib.decrypt(protected, key, ["configuration"]) == doc
+
+                protect_cost = timeit(
+                    lambda: cryptolib.protect_lib(
+                        dict(doc), key, ["configuration"], "compact", **options
+                    ),
+                    iterations,
+                )
+                decrypt_cost = timeit(
+                    lambda: cryptolib.decrypt(protected, key, ["configuration"]),
+                    iterations,
+                )
+                label = (
+                    "off" if compression_level is None else f"zlib-{compression_level}"
+                )
+                print(
+                    f"  {label:<7} {len(protected['configuration']):7d} bytes  "
+                    f"protect {protect_cost:8.1f} us  decrypt {decrypt_cost:8.1f} us"
+                )
+
+
+@cli.command()
+@click.option("--profiles", "-p", default=4, show_default=True)
+@click.option("--chain", "-c", default=20, show_default=True)
+@click.option("--iterations", "-n", default=500, show_default=True)
+def delta(profiles: int, chain: int, iterations: int) -> None:
+    """Bytes sent per one-setting update, and the car's cost to rebuild."""
+    config = realistic_config(profiles)["profiles"]
+    changed = json.loads(json.dumps(config))
+    changed["driver-0"]["ac"] = not changed["driver-0"]["ac"]
+    with tempfile.TemporaryDirectory() as tmp:
+        key = cryptolib.KEYRING.load(write_throwaway_key(tmp))
+        full = cryptolib.protect_lib(
+            {"configuration": changed}, key, ["configuration"], "compact"
+        )
+        split = cryptolib.protect_lib(
+            {"configuration": config}, key, ["configuration"], "split"
+        )
+        update = cryptolib.protect_delta(config, changed, key)
+        print(f"  full update   {len(json.dumps(full['configuration'])):7d} bytes")
+        print(f"  delta update  {len(json.dumps(update)):7d} bytes")
+
+        deltas = [update] * chain
+        merged = split["configuration"]
+        for entry in deltas:
+            merged = cryptolib.merge_delta(merged, entry)
+        assert cryptolib.decrypt({"configuration": merged}, key, ["configuration"]) == {
+            "configuration": changed
+        }
+
+        def rebuild():
+            merged = split["configuration"]
+            for entry in deltas:
+                merged = cryptolib.merge_delta(merged, entry)
+
+        protect_cost = timeit(
+            lambda: cryptolib.protect_delta(config, changed, key), iterations
+        )
+        rebuild_cost = timeit(rebuild, iterations)
+        print(f"  protect_delta {protect_cost:8.1f} us")
+        print(f"  rebuild of snapshot + {chain} deltas {rebuild_cost:8.1f} us")
+
+
+@cli.command()
+@click.option("--fields", "-f", default=200, show_default=True)
+@click.option("--field-size", "-s", default=4096, show_default=True)
+@click.option("--iterations", "-n", default=50, show_default=True)
+def lazy(fields: int, field_size: int, iterations: int) -> None:
+    """Reading one field of a large document: decrypt vs ProtectedDocument."""
+    target_fields = [f"field{i}" for i in range(fields)]
+    doc = {"carId": 1, "user": 1}
+    for field in target_fields:
+        doc[field] = {"tire_pressure": {"1": "1psi"}, "blob": "x" * field_size}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        handle = cryptolib.KEYRING.load(write_throwaway_key(tmp))
+    protected = cryptolib.protect_lib(dict(doc), handle, target_fields, "compact")
+
+    def eager():
+        return cryptolib.decrypt(protected, handle, target_fields)["field0"][
+            "tire_pressure"
+        ]
+
+    def lazy_view():
+        view = cryptolib.ProtectedDocument(protected, handle, target_fields)
+        return view["field0"]["tire_pressure"]
+
+    print(f"{fields} protected fields of ~{field_size} bytes, reading one sub-key")
+    for name, fn in (("decrypt", eager), ("ProtectedDocument", lazy_view)):
+        latency = timeit(fn, iterations)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {name:<18} {latency:10.1f} us  peak {peak / 1024:8.1f} KiB")
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=200, show_default=True)
+@click.option(
+    "--size",
+    "-s",
+    multiple=True,
+    type=int,
+    default=[32, 4096, 1 << 20],
+    show_default=True,
+)
+def encrypt(iterations: int, size: list[int]) -> None:
+    """PKI.encrypt_data / decrypt_data with plain RSA-OAEP versus hybrid."""
+    with tempfile.TemporaryDirectory() as tmp:
+        identities = {
+            key_type: write_throwaway_identity(tmp, key_type, key_type)
+            for key_type in ("rsa", "ec")
+        }
+        cases = [("rsa", "rsa"), ("rsa", "hybrid"), ("ec", "hybrid")]
+
+        for payload_size in size:
+            payload = secrets.token_bytes(payload_size)
+            print(f"{payload_size} byte payload")
+            for key_type, mode in cases:
+                key_path, _, cert = identities[key_type]
+                if (
+                    mode == "rsa"
+                    and payload_size > cert.public_key().key_size // 8 - 66
+                ):
+                    print(f"  {key_type + '/' + mode:<10} does not fit")
+                    continue
+                decryptor = cryptolib.Decryptor.for_file(key_path)
+                sealed = cryptolib.PKI.encrypt_data(payload, cert, mode)
+                assert decryptor.decrypt_bytes(sealed) == payload
+
+                encrypt_cost = timeit(
+                    lambda: cryptolib.PKI.encrypt_data(payload, cert, mode), iterations
+                )
+                decrypt_cost = timeit(
+                    lambda: decryptor.decrypt_bytes(sealed), iterations
+                )
+                print(
+                    f"  {key_type + '/' + mode:<10} encrypt {encrypt_cost:9.1f} us  "
+                    f"decrypt {decrypt_cost:9.1f} us  {len(sealed):8d} bytes"
+                )
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=500, show_default=True)
+def signatures(iterations: int) -> None:
+    """Signs/s and verifies/s for RSA-PSS, ECDSA P-256 and Ed25519."""
+    firmware = "firmware-1-v1700000000"
+    cache = cryptolib.PKI.verification_cache
+    maxsize, cache.maxsize = cache.maxsize, 0
+    cache.clear()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for key_type in KEY_TYPES:
+                key_path, _, cert = write_throwaway_identity(tmp, key_type, key_type)
+                signer = cryptolib.Signer.for_file(key_path)
+                signature = signer.sign(firmware)
+                assert cryptolib.PKI.verify_signature(cert, firmware, signature)
+
+                sign_cost = timeit(lambda: signer.sign(firmware), iterations)
+                verify_cost = timeit(
+                    lambda: cryptolib.PKI.verify_signature(cert, firmware, signature),
+                    iterations,
+                )
+                print(
+                    f"  {cryptolib.signature_algorithm(signer.private_key):<8} "
+                    f"{1e6 / sign_cost:8.0f} signs/s  "
+                    f"{1e6 / verify_cost:8.0f} verifies/s  "
+                    f"{len(signature):4d} byte signature"
+                )
+    finally:
+        cache.maxsize = maxsize
+
+
+SUITE_OPERATIONS = (
+    "protect_lib",
+    "decrypt",
+    "sign_data",
+    "verify_signature",
+    "encrypt_data",
+    "decrypt_data",
+)
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+
+def measure(fn, iterations, traced=20):
+    """
+    Times `fn` one call at a time, then traces the memory allocated by up to
+    `traced` further calls.
+
+    Returns:
+        dict: throughput, mean and percentile latency in microseconds, and the
+            median peak of memory allocated by a single call in bytes
+    """
+    for _ in range(min(iterations, 10)):
+        fn()  # warm-up
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, traced)):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, len(samples) * p // 100)] / 1e3
+
+    return {
+        "iterations": iterations,
+        "ops_per_s": round(1e9 * iterations / sum(samples), 1),
+        "mean_us": round(sum(samples) / iterations / 1e3, 1),
+        "p50_us": round(percentile(50), 1),
+        "p90_us": round(percentile(90), 1),
+        "p99_us": round(percentile(99), 1),
+        "alloc_bytes": peaks[len(peaks) // 2],
+    }
+
+
+def suite_cases(directory, operations, key_types, payload_sizes, seed):
+    """
+    Yields (operation, key type, payload size, callable) for every benchmark
+    case, each on a throwaway key and a payload drawn from `seed`.
+    """
+    rng = random.Random(seed)
+    payloads = {
+        size: "".join(rng.choices(string.ascii_letters + string.digits, k=size))
+        for size in payload_sizes
+    }
+
+    key_path = write_throwaway_key(directory)
+    for size, payload in payloads.items():
+        doc = {"carId": 1, "user": 1, "configuration": {"blob": payload}}
+        # protect_lib encrypts in place, so every call gets a shallow copy.
+        protected = cryptolib.protect_lib(dict(doc), key_path, ["configuration"])
+        if "protect_lib" in operations:
+            yield (
+                "protect_lib",
+                None,
+                size,
+                lambda doc=doc: cryptolib.protect_lib(
+                    dict(doc), key_path, ["configuration"]
+                ),
+            )
+        if "decrypt" in operations:
+            yield (
+                "decrypt",
+                None,
+                size,
+                functools.partial(
+                    cryptolib.decrypt, protected, key_path, ["configuration"]
+                ),
+            )
+
+    for key_type in key_types:
+        private_key_path, cert_path, cert = write_throwaway_identity(
+            directory, key_type, key_type
+        )
+        for size, payload in payloads.items():
+            signature = cryptolib.sign_data(private_key_path, payload)
+            if "sign_data" in operations:
+                yield (
+                    "sign_data",
+                    key_type,
+                    size,
+                    functools.partial(cryptolib.sign_data, private_key_path, payload),
+                )
+            if "verify_signature" in operations:
+                yield (
+                    "verify_signature",
+                    key_type,
+                    size,
+                    functools.partial(
+                        cryptolib.PKI.verify_signature, cert, payload, signature
+                    ),
+                )
+            # Ed25519 keys can sign but cannot agree on a key.
+            if key_type == "ed25519":
+                continue
+            encrypted = cryptolib.PKI.encrypt_data(payload, cert_path)
+            if "encrypt_data" in operations:
+                yield (
+                    "encrypt_data",
+                    key_type,
+                    size,
+                    functools.partial(cryptolib.PKI.encrypt_data, payload, cert_path),
+                )
+            if "decrypt_data" in operations:
+                yield (
+                    "decrypt_data",
+                    key_type,
+                    size,
+                    functools.partial(
+                        cryptolib.PKI.decrypt_data, encrypted, private_key_path
+                    ),
+                )
+
+
+def case_id(result):
+    return (result["operation"], result["key_type"], result["payload_size"])
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Annotates each result with its speed change against the matching baseline
+    case, measured on the median latency so a few preempted calls do not read
+    as a regression.
+
+    Returns:
+        list[dict]: the results slower than the baseline by more than
+            `threshold` (a fraction)
+    """
+    previous = {case_id(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_id(result))
+        if old is None:
+            continue
+        change = old["p50_us"] / result["p50_us"] - 1
+        result["baseline_p50_us"] = old["p50_us"]
+        result["change"] = round(change, 3)
+        if change < -threshold:
+            regressions.append(result)
+    return regressions
+
+
+@cli.command()
+@click.option("--iterations", "-n", default=200, show_default=True)
+@click.option(
+    "--repeat", "-r", default=3, show_default=True, help="Runs kept at best of."
+)
+@click.option(
+    "--payload-size",
+    "-s",
+    multiple=True,
+    type=int,
+    default=(64, 1024, 16384),
+    show_default=True,
+)
+@click.option(
+    "--key-type",
+    "-k",
+    multiple=True,
+    type=click.Choice(list(KEY_TYPES)),
+    default=tuple(KEY_TYPES),
+    show_default=True,
+)
+@click.option(
+    "--operation",
+    "-op",
+    multiple=True,
+    type=click.Choice(SUITE_OPERATIONS),
+    default=SUITE_OPERATIONS,
+    show_default=True,
+)
+@click.option("--seed", default=0, show_default=True, help="Payload seed.")
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    default="-",
+    help="Where to write the JSON results.",
+)
+@click.option(
+    "--baseline",
+    "-b",
+    type=click.Path(dir_okay=False),
+    default=BASELINE_PATH,
+    show_default=True,
+    help="Stored results to compare against (skipped when missing).",
+)
+@click.option(
+    "--threshold",
+    "-t",
+    default=0.3,
+    show_default=True,
+    help="Slowdown (fraction of baseline speed) reported as a regression.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    help="Store these results as the new baseline instead of comparing.",
+)
+def suite(
+    iterations: int,
+    repeat: int,
+    payload_size: tuple[int],
+    key_type: tuple[str],
+    operation: tuple[str],
+    seed: int,
+    output: str,
+    baseline: str,
+    threshold: float,
+    save_baseline: bool,
+) -> None:
+    """
+    Benchmarks the cryptolib primitives on throwaway keys and writes the results
+    as JSON, flagging regressions against a stored baseline.
+    """
+    cache = cryptolib.PKI.verification_cache
+    maxsize, cache.maxsize = cache.maxsize, 0
+    cache.clear()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, kind, size, fn in suite_cases(
+                tmp, operation, key_type, payload_size, seed
+            ):
+                result = {"operation": name, "key_type": kind, "payload_size": size}
+                runs = [measure(fn, iterations) for _ in range(repeat)]
+                result.update(min(runs, key=lambda run: run["p50_us"]))
+                results.append(result)
+    finally:
+        cache.maxsize = maxsize
+
+    regressions = []
+    if not save_baseline and os.path.exists(baseline):
+        with open(baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), threshold)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "cryptography": cryptography.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {"iterations": iterations, "repeat": repeat, "seed": seed},
+        "results": results,
+        "regressions": [case_id(result) for result in regressions],
+    }
+    with click.open_file(baseline if save_baseline else output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    for result in results:
+        change = result.get("change")
+        click.echo(
+            f"{result['operation']:<16} {result['key_type'] or '-':<8} "
+            f"{result['payload_size']:>6} B {result['ops_per_s']:>10.0f} ops/s  "
+            f"p50 {result['p50_us']:>9.1f} us  p99 {result['p99_us']:>9.1f} us  "
+            f"{result['alloc_bytes']:>8} B"
+            + ("" if change is None else f"  {change:+7.1%}")
+            + ("  REGRESSION" if result in regressions else ""),
+            err=True,
+        )
+    if regressions:
+        sys.exit(1)
+
+
+def percentile(samples, p):
+    """`p`th percentile of sorted `samples`."""
+    return samples[min(len(samples) - 1, len(samples) * p // 100)]
+
+
+@cli.command()
+@click.argument("url")
+@click.option("--cert", required=True, help="Client certificate (PEM).")
+@click.option("--key", required=True, help="Client private key (PEM).")
+@click.option("--ca", required=True, help="CA certificate of the server.")
+@click.option("--connections", "-c", default=8, show_default=True)
+@click.option("--requests", "-n", "count", default=2000, show_default=True)
+@click.option(
+    "--keep-alive/--no-keep-alive",
+    default=True,
+    show_default=True,
+    help="Reuse each connection, or open one per request.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    show_default=True,
+    help="Resume TLS sessions when reconnecting (Common's client sessions).",
+)
+def http(
+    url: str,
+    cert: str,
+    key: str,
+    ca: str,
+    connections: int,
+    count: int,
+    keep_alive: bool,
+    resume: bool,
+) -> None:
+    """Requests/s and latency of a mutual TLS endpoint, e.g. a running car."""
+    latencies = []
+    errors = []
+    sessions = []
+
+    def client():
+        if resume:
+            # Imported here, as common needs a key store (KEY_STORE).
+            from common import Common
+
+            session = Common.build_tls_session(ca, cert, key)
+        else:
+            session = requests.Session()
+            session.verify = ca
+            session.cert = (cert, key)
+        sessions.append(session)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        for _ in range(count // connections):
+            start = time.perf_counter()
+            response = session.get(url)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(
+        f"  {len(latencies) / elapsed:8.0f} req/s  "
+        f"p50 {percentile(latencies, 50) * 1e3:7.2f} ms  "
+        f"p99 {percentile(latencies, 99) * 1e3:7.2f} ms  "
+        f"{len(errors)} errors"
+    )
+    if resume:
+        handshakes = resumed = 0
+        for session in sessions:
+            stats = session.get_adapter(url).ssl_context.handshake_stats
+            handshakes += stats.handshakes
+            resumed += stats.resumed
+        print(f"  {handshakes} TLS handshakes, {resumed} resumed")
+
+
+if __name__ == "__main__":
+    cli()
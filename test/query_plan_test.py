@@ -0,0 +1,190 @@
+import os
+import sys
+
+from psycopg import sql
+from psycopg_pool import ConnectionPool
+from car.main import (
+    CONFIG_CHAIN_QUERY,
+    CURRENT_FIRMWARE_QUERY,
+    FIRMWARE_COLUMNS,
+    LATEST_TEST_QUERY,
+    MECHANIC_CERTS_QUERY,
+    TEST_COLUMNS,
+    history_page_query,
+    reverify_page_query,
+)
+from common.migrations import migrate
+from manufacturer.main import FIRMWARE_HISTORY_QUERY
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+CAR_PG_CONNSTRING = os.getenv(
+    "CAR_PG_CONNSTRING",
+    "host=localhost port=7464 dbname=motorist-car-db user=postgres password=password",
+)
+MANUFACTURER_PG_CONNSTRING = os.getenv(
+    "MANUFACTURER_PG_CONNSTRING",
+    "host=localhost port=7654 dbname=motorist-manufacturer-db user=postgres password=password",
+)
+
+# The hot queries of the car, with sample parameters and the index each one
+# should use.
+CAR_QUERIES = {
+    "current config (load_config_chain)": (
+        sql.SQL(CONFIG_CHAIN_QUERY),
+        {"car_id": 1, "user_id": "1"},
+        "configurations_car_user_id_idx",
+    ),
+    "current firmware (load_current_firmware)": (
+        sql.SQL(CURRENT_FIRMWARE_QUERY),
+        {"car_id": 1},
+        "firmwares_car_id_idx",
+    ),
+    "latest test (load_latest_test)": (
+        sql.SQL(LATEST_TEST_QUERY),
+        {"car_id": 1},
+        "mechanic_tests_car_id_idx",
+    ),
+    "firmware history page (iter_history)": (
+        history_page_query("firmwares", FIRMWARE_COLUMNS, after_id=1000),
+        {"car_id": 1, "after_id": 1000, "limit": 100},
+        "firmwares_car_id_idx",
+    ),
+    "tests history page (iter_history)": (
+        history_page_query("mechanic_tests", TEST_COLUMNS, after_id=1000),
+        {"car_id": 1, "after_id": 1000, "limit": 100},
+        "mechanic_tests_car_id_idx",
+    ),
+    "firmware re-verification (reverify_table)": (
+        reverify_page_query("firmwares", FIRMWARE_COLUMNS),
+        {"car_id": 1, "last_id": 0, "limit": 100},
+        "firmwares_car_id_idx",
+    ),
+    "tests re-verification (reverify_table)": (
+        reverify_page_query("mechanic_tests", TEST_COLUMNS),
+        {"car_id": 1, "last_id": 0, "limit": 100},
+        "mechanic_tests_car_id_idx",
+    ),
+    "mechanic certificates (load_mechanic_certs)": (
+        sql.SQL(MECHANIC_CERTS_QUERY),
+        {"ids": [1, 2]},
+        "mechanic_certificates_pkey",
+    ),
+}
+
+# The hot queries of the manufacturer, with sample parameters and the index
+# each one should use.
+MANUFACTURER_QUERIES = {
+    "firmware history (get_history)": (
+        sql.SQL(FIRMWARE_HISTORY_QUERY),
+        {"car_id": 1},
+        "firmware_requests_car_id_idx",
+    ),
+}
+
+# Rows for many cars, so that the planner only picks an index that narrows the
+# scan down to one car. They are rolled back once the plans are checked.
+CAR_SEED = """
+INSERT INTO configurations (car_id, user_id, config, is_delta)
+SELECT car_id, user_id::text, '{}', n % 10 <> 1
+FROM generate_series(1, 50) AS car_id,
+    generate_series(1, 4) AS user_id,
+    generate_series(1, 50) AS n;
+INSERT INTO firmwares (car_id, firmware, signature, timestamp)
+SELECT car_id, 'v' || n, '', NOW()
+FROM generate_series(1, 50) AS car_id, generate_series(1, 200) AS n;
+INSERT INTO mechanic_certificates (fingerprint, certificate)
+SELECT 'query-plan-test-' || n, ''
+FROM generate_series(1, 1000) AS n;
+INSERT INTO mechanic_tests (car_id, tests, signature, timestamp, mechanic_cert_id)
+SELECT car_id, '{}', '', NOW(), (SELECT MIN(id) FROM mechanic_certificates)
+FROM generate_series(1, 50) AS car_id, generate_series(1, 200) AS n;
+ANALYZE configurations, firmwares, mechanic_certificates, mechanic_tests;
+"""
+MANUFACTURER_SEED = """
+INSERT INTO firmware_requests (car_id, firmware, signature, timestamp)
+SELECT car_id, 'v' || n, '', NOW()
+FROM generate_series(1, 50) AS car_id, generate_series(1, 200) AS n;
+ANALYZE firmware_requests;
+"""
+
+
+def seq_scans(plan):
+    """Returns the tables the plan, or one of its sub-plans, scans sequentially."""
+    tables = []
+    if plan["Node Type"] == "Seq Scan":
+        tables.append(plan["Relation Name"])
+    for sub_plan in plan.get("Plans", []):
+        tables += seq_scans(sub_plan)
+    return tables
+
+
+def index_names(plan):
+    """Returns the indexes the plan, or one of its sub-plans, scans."""
+    indexes = []
+    if "Index Name" in plan:
+        indexes.append(plan["Index Name"])
+    for sub_plan in plan.get("Plans", []):
+        indexes += index_names(sub_plan)
+    return indexes
+
+
+def check_queries(name, conninfo, migrations_dir, seed, queries):
+    """
+    Migrates the database and seeds it, then checks that every query scans
+    the index it is expected to use, and no other table or index.
+    """
+    failures = 0
+    with ConnectionPool(conninfo, min_size=1, max_size=1) as pool:
+        migrate(pool, migrations_dir)
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(seed)
+                # Rule out sequential scans, so that a missing index shows up
+                # as the planner falling back to another one.
+                cur.execute("SET LOCAL enable_seqscan = off;")
+                for query_name, (query, params, index) in queries.items():
+                    cur.execute(
+                        sql.SQL("EXPLAIN (FORMAT JSON) {}").format(query), params
+                    )
+                    plan = cur.fetchone()[0][0]["Plan"]
+                    tables = seq_scans(plan)
+                    indexes = index_names(plan)
+                    if tables:
+                        failures += 1
+                        print(
+                            f"{name} {query_name}: FAILURE, sequential scan of {', '.join(tables)}"
+                        )
+                    elif set(indexes) != {index}:
+                        failures += 1
+                        print(
+                            f"{name} {query_name}: FAILURE, expected {index}, scanned {', '.join(indexes)}"
+                        )
+                    else:
+                        print(f"{name} {query_name}: SUCCESS")
+            conn.rollback()
+    return failures
+
+
+def main():
+    failures = check_queries(
+        "Car",
+        CAR_PG_CONNSTRING,
+        os.path.join(SRC, "car", "data", "migrations"),
+        CAR_SEED,
+        CAR_QUERIES,
+    )
+    failures += check_queries(
+        "Manufacturer",
+        MANUFACTURER_PG_CONNSTRING,
+        os.path.join(SRC, "manufacturer", "data", "migrations"),
+        MANUFACTURER_SEED,
+        MANUFACTURER_QUERIES,
+    )
+    if failures:
+        print(f"\n{failures} queries do not use their index")
+        sys.exit(1)
+    print("\nEvery query uses its index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import io
+import json
+import sys
+
+from cryptolib.main import iter_json_records
+
+# Streams of whitespace separated documents, parsed like JSON Lines.
+DOCUMENTS = [
+    '{"a": 1}\n{"b": [true, false, null]}\n',
+    '1 22 333 -4.5e-6 7E+8 0\n"x"',
+    '"\\u00e9t\\u00e9 \\"quoted\\" \\\\ \\n" "été ✓ 𝄞"',
+    '{"nested": {"list": [1, [2, [3]], {"k": "v"}]}}   \n\n  [4, 5]',
+    "-Infinity NaN true",
+    "",
+    "  \n ",
+]
+# Top-level arrays, whose elements are yielded one by one.
+ARRAYS = [
+    "[]",
+    " [ ] \n",
+    "[1]",
+    "[1, 22, 333, -4.5e-6]",
+    '[{"a": "b"}, [1, 2], "s", true, null, 12345678901234567890]',
+    '[\n  {"field": "\\u00e9 𝄞"},\n  {"field": "x"}\n]\n',
+]
+# Inputs that must be rejected, whatever the chunk boundaries.
+INVALID = [
+    "[1,,2]",
+    "[1 2]",
+    "[,1]",
+    "[1,]",
+    "[1",
+    "[1]  [2]",
+    "[1,2],",
+    "[1] x",
+    '{"a": }',
+    '{"a": 1',
+    '"unterminated',
+    "1 2x",
+    "tru",
+]
+
+
+class Trickle(io.RawIOBase):
+    """A stream answering each read with at most `step` bytes."""
+
+    def __init__(self, data: bytes, step: int):
+        self.data, self.pos, self.step, self.reads = data, 0, step, 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        size = self.step if size < 0 else min(size, self.step)
+        chunk = self.data[self.pos : self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def parse(text: str, step: int, chunk_size: int):
+    stream = Trickle(text.encode("utf-8"), step)
+    return list(iter_json_records(stream, chunk_size=chunk_size))
+
+
+def expected(text: str):
+    if text.strip().startswith("["):
+        return json.loads(text)
+    decoder, records, pos = json.JSONDecoder(), [], 0
+    while text[pos:].strip():
+        record, pos = decoder.raw_decode(text, len(text) - len(text[pos:].lstrip()))
+        records.append(record)
+    return records
+
+
+def check(name, text, valid):
+    """Parses `text` cut at every possible boundary."""
+    for step in range(1, 9):
+        for chunk_size in (1, 3, 1 << 16):
+            try:
+                records = parse(text, step, chunk_size)
+            except json.JSONDecodeError as e:
+                if valid:
+                    return f"step {step}, chunk {chunk_size}: {e}"
+                continue
+            if not valid:
+                return f"step {step}, chunk {chunk_size}: accepted as {records!r}"
+            # NaN is the only value not equal to itself.
+            if json.dumps(records) != json.dumps(expected(text)):
+                return f"step {step}, chunk {chunk_size}: got {records!r}"
+    return None
+
+
+def check_large_document():
+    """A document much larger than a chunk is read in few, growing reads."""
+    text = json.dumps({"field": "x" * (1 << 20)})
+    stream = Trickle(text.encode("utf-8"), 1 << 30)
+    records = list(iter_json_records(stream, chunk_size=16))
+    if records != [json.loads(text)]:
+        return "wrong document"
+    if stream.reads > 64:
+        return f"{stream.reads} reads"
+    return None
+
+
+def main():
+    failures = 0
+    cases = [(text, True) for text in DOCUMENTS + ARRAYS]
+    cases += [(text, False) for text in INVALID]
+    for text, valid in cases:
+        error = check(text, text, valid)
+        if error:
+            failures += 1
+            print(f"{text!r}: FAILURE, {error}")
+        else:
+            print(f"{text!r}: SUCCESS")
+    error = check_large_document()
+    if error:
+        failures += 1
+        print(f"large document: FAILURE, {error}")
+    else:
+        print("large document: SUCCESS")
+    if failures:
+        print(f"\n{failures} inputs parsed wrongly")
+        sys.exit(1)
+    print("\nEvery input parsed correctly")
+
+
+if __name__ == "__main__":
+    main()